@@ -0,0 +1,67 @@
+from .cube import cube_hourly
+from .hourly import HOUR_ORDERS
+from .propagation import MIN_TURNAROUND
+from .ranking import top_n, top_rows
+from .schema import BRACKET_EDGE_CHOICES, DELAY_BRACKET_EDGES
+from .sketches import QUANTILES
+from .store import (
+    FlightStore,
+    aircraft_flights,
+    airport_cities,
+    airport_codes,
+    airport_conditions,
+    airport_places,
+    daily_delay_quantile,
+    daily_delays,
+    day_window,
+    delay_counts,
+    delay_means,
+    delay_quantiles,
+    delay_summary,
+    delay_totals,
+    filed_months,
+    get_store,
+    hourly_delay_quantile,
+    hourly_delays,
+    latest_filed_time,
+    overview_cube,
+    previous_legs,
+    slice_flights,
+    time_window,
+    trace_delays,
+)
+
+__all__ = [
+    "BRACKET_EDGE_CHOICES",
+    "DELAY_BRACKET_EDGES",
+    "HOUR_ORDERS",
+    "MIN_TURNAROUND",
+    "QUANTILES",
+    "FlightStore",
+    "aircraft_flights",
+    "airport_cities",
+    "airport_codes",
+    "airport_conditions",
+    "airport_places",
+    "cube_hourly",
+    "daily_delay_quantile",
+    "daily_delays",
+    "day_window",
+    "delay_counts",
+    "delay_means",
+    "delay_quantiles",
+    "delay_summary",
+    "delay_totals",
+    "filed_months",
+    "get_store",
+    "hourly_delay_quantile",
+    "hourly_delays",
+    "latest_filed_time",
+    "overview_cube",
+    "previous_legs",
+    "slice_flights",
+    "time_window",
+    "top_n",
+    "top_rows",
+    "trace_delays",
+]
@@ -0,0 +1,3 @@
+from .ingest import main
+
+main()
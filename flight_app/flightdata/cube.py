@@ -0,0 +1,54 @@
+"""Pre-aggregated cube behind the Overview page.
+
+One row per (filed date, filed hour, ADEP, AC Operator, delay bin) that has
+flights, holding the flight count. The delay bin is the departure delay binned
+on BRACKET_EDGE_CHOICES, so brackets on any subset of those edges are rebinned
+from it. Ingest writes one cube file per batch; cubes of different batches
+simply add up, so the store concatenates them.
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from .schema import BRACKET_EDGE_CHOICES, DELAY_BRACKET_EDGES, bin_delays, rebin_delays
+
+CUBE_KEYS = ["FILED DATE", "DEP HOUR", "ADEP", "AC Operator", "DELAY BIN"]
+# Flight columns a cube is built from
+CUBE_COLUMNS = ["FILED OFF BLOCK TIME", "DEP HOUR", "ADEP", "AC Operator", "DEPTDEL"]
+
+
+def build_cube(df: pd.DataFrame) -> pd.DataFrame:
+    """Aggregate flights into cube rows, sorted by filed date.
+
+    Flights without a filed off-block time have no date and are left out;
+    missing airports or operators are kept as their own key.
+    """
+    df = df[df["FILED OFF BLOCK TIME"].notna()]
+    frame = df[CUBE_KEYS[1:4]].assign(**{
+        "FILED DATE": df["FILED OFF BLOCK TIME"].dt.normalize(),
+        "DELAY BIN": bin_delays(df["DEPTDEL"].to_numpy(), BRACKET_EDGE_CHOICES).astype(np.int8),
+    })
+    return (frame.groupby(CUBE_KEYS, observed=True, dropna=False)
+            .size().reset_index(name="flights"))
+
+
+def sort_cube(cube: pd.DataFrame) -> pd.DataFrame:
+    return cube.sort_values("FILED DATE", kind="stable").reset_index(drop=True)
+
+
+def cube_days(cube: pd.DataFrame, first: date, last: date) -> pd.DataFrame:
+    """Rows of a date-sorted cube for ``first``..``last`` (inclusive), by binary search."""
+    dates = cube["FILED DATE"].to_numpy()
+    lo = np.searchsorted(dates, np.datetime64(first, "ns"), side="left")
+    hi = np.searchsorted(dates, np.datetime64(last, "ns"), side="right")
+    return cube.iloc[lo:max(lo, hi)]
+
+
+def cube_hourly(rows: pd.DataFrame, edges=DELAY_BRACKET_EDGES) -> pd.DataFrame:
+    """Flights per filed hour (``TimeBin``) and ``Delay Bracket`` on ``edges``, as ``Count``."""
+    time_bin = rows["FILED DATE"] + pd.to_timedelta(rows["DEP HOUR"], unit="h")
+    brackets = rebin_delays(rows["DELAY BIN"].to_numpy(), edges)
+    return (rows.assign(TimeBin=time_bin, **{"Delay Bracket": brackets})
+            .groupby(["TimeBin", "Delay Bracket"], observed=True)["flights"].sum()
+            .reset_index(name="Count"))
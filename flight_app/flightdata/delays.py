@@ -0,0 +1,189 @@
+"""Threshold-independent index of departure delay counts.
+
+For every filed day and every value of a key dimension (airport, airline,
+country/city), the index holds how many flights left late by each whole minute
+up to MAX_THRESHOLD, and the count and sum of the departure and arrival
+delays. Only the combinations that occur are kept, ordered by day, so the index
+grows with the flights rather than with days x keys x thresholds. Counting the
+delayed flights for any threshold, or the mean delay, over any date range sums
+the entries of the days in range, however many flights there are.
+"""
+from datetime import date
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+# Largest threshold (minutes) the index answers; the pages' sliders stay within it
+MAX_THRESHOLD = 120
+
+# Dimensions the counts are broken down by; a tuple groups by all its columns
+DELAY_KEYS = [("ADEP",), ("AC Operator",), ("Country", "City")]
+DELAY_INDEX_COLUMNS = ["FILED OFF BLOCK TIME", "DEPTDEL", "ARVLDEL", "ADEP", "AC Operator",
+                       "Country", "City"]
+# Delay measures and the column prefix of their sums
+DELAY_MEASURES = {"DEPTDEL": "dep", "ARVLDEL": "arr"}
+# Per-measure statistics the index sums, in the order range_sums() returns them
+DELAY_SUMS = [f"{prefix}_{stat}" for prefix in DELAY_MEASURES.values() for stat in ("count", "sum")]
+
+_EPOCH = date(1970, 1, 1)
+
+
+def delay_bins(delays: np.ndarray) -> np.ndarray:
+    """Bin delays so that ``delay > t`` holds exactly when ``bin >= t`` for whole minutes t.
+
+    Missing delays and delays of zero or less land in bin -1, delays beyond
+    MAX_THRESHOLD in bin MAX_THRESHOLD.
+    """
+    bins = np.nan_to_num(np.ceil(delays) - 1, nan=-1)
+    return np.clip(bins, -1, MAX_THRESHOLD).astype(np.int16)
+
+
+def threshold_column(threshold) -> int:
+    """Column of a count array holding the flights delayed more than ``threshold``."""
+    if threshold != int(threshold) or not 0 <= threshold <= MAX_THRESHOLD:
+        raise ValueError(f"Delay thresholds must be whole minutes in 0..{MAX_THRESHOLD}")
+    return int(threshold) + 1
+
+
+class DelayIndex:
+    """Per-minute delay counts per (day, key) for each of DELAY_KEYS.
+
+    Built from the DELAY_INDEX_COLUMNS of the flight table; flights without a
+    filed off-block time belong to no day and are left out. Rows pre-aggregated
+    by a query engine carry a ``flights`` column and count that many times, and
+    carry their delays' DELAY_SUMS instead of the delays themselves.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        filed = frame["FILED OFF BLOCK TIME"].to_numpy(dtype="datetime64[D]")
+        known = ~np.isnat(filed)
+        day = filed[known].astype(np.int64)
+        self._first_day = int(day.min()) if len(day) else 0
+        self._n_days = int(day.max()) - self._first_day + 1 if len(day) else 0
+        day = day - self._first_day
+        # Column 0 counts every flight, column t+1 those delayed more than t
+        bins = delay_bins(frame["DEPTDEL"].to_numpy(dtype=float)[known]) + 1
+        flights = frame["flights"].to_numpy()[known] if "flights" in frame else None
+        width = MAX_THRESHOLD + 2
+        if flights is None:
+            sums = _delay_sums(frame, known)
+            flights = np.ones(len(day))
+        else:
+            sums = [frame[col].to_numpy(dtype=float)[known] for col in DELAY_SUMS]
+
+        self._keys: dict[tuple, pd.DataFrame] = {}
+        self._counts: dict[tuple, _DayEntries] = {}
+        self._sums: dict[tuple, _DayEntries] = {}
+        for key in DELAY_KEYS:
+            codes = np.stack([frame[col].cat.codes.to_numpy()[known] for col in key], axis=1)
+            missing = (codes < 0).any(axis=1)
+            # Observed combinations in code order, as groupby(observed=True) lists them
+            combos, slot = np.unique(codes[~missing], axis=0, return_inverse=True)
+            # One extra slot collects flights with a missing key value
+            n_slots = len(combos) + 1
+            slots = np.full(len(day), len(combos))
+            slots[~missing] = slot.ravel()
+            self._counts[key] = _DayEntries(day, slots * width + bins, n_slots * width,
+                                            flights[:, None], self._n_days, np.int32)
+            self._sums[key] = _DayEntries(day, slots, n_slots, np.stack(sums, axis=1),
+                                          self._n_days, float)
+            self._keys[key] = pd.DataFrame({
+                col: pd.Categorical.from_codes(combos[:, i], dtype=frame[col].dtype)
+                for i, col in enumerate(key)})
+
+    def _days(self, first: date, last: date) -> tuple[int, int]:
+        lo = min(max((first - _EPOCH).days - self._first_day, 0), self._n_days)
+        hi = min(max((last - _EPOCH).days - self._first_day + 1, lo), self._n_days)
+        return lo, hi
+
+    def range_counts(self, first: date, last: date, key: tuple):
+        """Key values of ``key`` and their counts over flights filed ``first``..``last``.
+
+        Row i of the returned array belongs to row i of the key frame; its
+        last row collects flights with a missing key. Use threshold_column()
+        to pick a threshold.
+        """
+        counts = self._counts[key].total(*self._days(first, last))
+        counts = counts.reshape(-1, MAX_THRESHOLD + 2).astype(np.int64)
+        # Flights delayed more than t are those in bin t+1 or any later bin
+        return self._keys[key], counts[:, ::-1].cumsum(axis=1)[:, ::-1]
+
+    def range_sums(self, first: date, last: date, key: tuple):
+        """Key values of ``key`` and their DELAY_SUMS over flights filed ``first``..``last``.
+
+        Laid out like range_counts(), with one column per entry of DELAY_SUMS.
+        """
+        return self._keys[key], self._sums[key].total(*self._days(first, last))
+
+
+class _DayEntries:
+    """Values summed per (day, cell), keeping only the pairs that occur, ordered by day."""
+
+    def __init__(self, day, cell, n_cells, values, n_days, dtype):
+        pairs, inverse = np.unique(day * n_cells + cell, return_inverse=True)
+        inverse = inverse.ravel()
+        self._n_cells = n_cells
+        self._cells = (pairs % n_cells).astype(np.int32 if n_cells < 2**31 else np.int64)
+        self._values = np.stack([np.bincount(inverse, weights=column, minlength=len(pairs))
+                                 for column in values.T], axis=1).astype(dtype)
+        # Entries of day d are self._cells[self._starts[d]:self._starts[d + 1]]
+        self._starts = np.searchsorted(pairs // n_cells, np.arange(n_days + 1))
+
+    def total(self, lo: int, hi: int) -> np.ndarray:
+        """Values per cell summed over days ``lo``..``hi - 1``, one row per cell."""
+        rows = slice(self._starts[lo], self._starts[hi])
+        cells, values = self._cells[rows], self._values[rows]
+        return np.stack([np.bincount(cells, weights=column, minlength=self._n_cells)
+                         for column in values.T], axis=1)
+
+
+def _delay_sums(frame: pd.DataFrame, known: np.ndarray) -> list[np.ndarray]:
+    # Count and sum of each measure's known delays, flight by flight
+    sums = []
+    for col in DELAY_MEASURES:
+        values = frame[col].to_numpy(dtype=float)[known]
+        present = ~np.isnan(values)
+        sums += [present.astype(float), np.where(present, values, 0.0)]
+    return sums
+
+
+def delay_table(keys: pd.DataFrame, counts: np.ndarray, threshold) -> pd.DataFrame:
+    """Observed keys with their ``total_departures`` and ``delayed_flights`` at ``threshold``."""
+    table = keys.assign(total_departures=counts[:-1, 0],
+                        delayed_flights=counts[:-1, threshold_column(threshold)])
+    return table[table["total_departures"] > 0].reset_index(drop=True)
+
+
+class DelaySummary(NamedTuple):
+    """Delay counts for one date range and threshold, for every grouping the pages show.
+
+    The airport, airline and (Country, City) tables are laid out as by
+    delay_table(); the totals also count flights with a missing key.
+    """
+
+    airports: pd.DataFrame
+    airlines: pd.DataFrame
+    places: pd.DataFrame
+    total_departures: int
+    delayed_flights: int
+
+    def totals(self, airports=None) -> tuple[int, int]:
+        """(departures, delayed departures), only from ``airports`` if given."""
+        if not airports:
+            return self.total_departures, self.delayed_flights
+        rows = self.airports[self.airports["ADEP"].isin(airports)]
+        return int(rows["total_departures"].sum()), int(rows["delayed_flights"].sum())
+
+
+def summarize_delays(index: DelayIndex, first: date, last: date, threshold) -> DelaySummary:
+    """All grouping sets of DELAY_KEYS over ``first``..``last`` at ``threshold``."""
+    keys, counts = index.range_counts(first, last, ("ADEP",))
+    column = threshold_column(threshold)
+    return DelaySummary(
+        airports=delay_table(keys, counts, threshold),
+        airlines=delay_table(*index.range_counts(first, last, ("AC Operator",)), threshold),
+        places=delay_table(*index.range_counts(first, last, ("Country", "City")), threshold),
+        total_departures=int(counts[:, 0].sum()),
+        delayed_flights=int(counts[:, column].sum()),
+    )
@@ -0,0 +1,205 @@
+"""Query engines behind the store's flight-level aggregations.
+
+The pandas engine computes them from the columns the store holds in memory.
+The DuckDB and Polars engines run them over the dataset's parquet partitions,
+as SQL through an embedded DuckDB connection or as Polars lazy queries: scans
+are multi-threaded, only the referenced columns are read, time filters are
+pushed into the parquet readers and only the (much smaller) aggregates come
+into memory, so archives larger than RAM still serve the pages. Both are
+optional; without them, or without an ingested dataset, the pandas engine is
+used.
+"""
+import datetime
+import logging
+
+import pandas as pd
+
+from .delays import DELAY_INDEX_COLUMNS, MAX_THRESHOLD, DelayIndex
+from .hourly import HOURLY_COLUMNS, HOURLY_MEASURES, HourlyDelays
+from .schema import FILED_TIMES
+
+ENGINES = ["pandas", "duckdb", "polars"]
+
+log = logging.getLogger(__name__)
+
+
+class PandasEngine:
+    """Aggregations over the store's in-memory columns."""
+
+    name = "pandas"
+
+    def __init__(self, store):
+        self._store = store
+
+    def delay_index(self) -> DelayIndex:
+        return DelayIndex(self._store.frame(DELAY_INDEX_COLUMNS))
+
+    def hourly_delays(self) -> HourlyDelays:
+        return HourlyDelays(self._store.frame(HOURLY_COLUMNS))
+
+    def slice_by_time(self, col, start, end, columns, days=None, closed="left") -> pd.DataFrame:
+        return self._store.slice_by_time(col, start, end, columns, days=days, closed=closed)
+
+
+def _quote(col: str) -> str:
+    return '"' + col.replace('"', '""') + '"'
+
+
+def _timestamp(value) -> datetime.datetime:
+    return pd.Timestamp(value).to_pydatetime()
+
+
+# Delays ceiled to whole minutes within 0..MAX_THRESHOLD+1; delay_bins() maps
+# them to the same bins as the exact delays
+_DELAY_INDEX_SQL = f"""
+SELECT date_trunc('day', "FILED OFF BLOCK TIME") AS "FILED OFF BLOCK TIME",
+       CASE WHEN "DEPTDEL" > 0 THEN least(ceil("DEPTDEL"), {MAX_THRESHOLD + 1})
+            ELSE 0 END AS "DEPTDEL",
+       "ADEP", "AC Operator", "Country", "City", count(*) AS flights,
+       count(t."DEPTDEL") AS dep_count, coalesce(sum(t."DEPTDEL"), 0) AS dep_sum,
+       count("ARVLDEL") AS arr_count, coalesce(sum("ARVLDEL"), 0) AS arr_sum
+FROM read_parquet($files) AS t
+WHERE "FILED OFF BLOCK TIME" IS NOT NULL
+GROUP BY ALL
+"""
+
+_HOURLY_SQL = """
+SELECT "ADEP",
+       date_trunc('day', "FILED OFF BLOCK TIME") AS "FILED OFF BLOCK TIME",
+       "DEP HOUR ORDER", sum("DEPTDEL") AS "DEPTDEL",
+       NULL::TIMESTAMP AS "FILED ARRIVAL TIME", NULL::TINYINT AS "ARR HOUR ORDER",
+       NULL::DOUBLE AS "ARVLDEL", count(*) AS flights
+FROM read_parquet($files)
+WHERE "DEPTDEL" > 0 AND "ADEP" IS NOT NULL
+  AND "FILED OFF BLOCK TIME" IS NOT NULL AND "FILED ARRIVAL TIME" IS NOT NULL
+GROUP BY ALL
+UNION ALL
+SELECT "ADEP",
+       NULL::TIMESTAMP, NULL::TINYINT, NULL::DOUBLE,
+       date_trunc('day', "FILED ARRIVAL TIME"), "ARR HOUR ORDER", sum("ARVLDEL"), count(*)
+FROM read_parquet($files)
+WHERE "ARVLDEL" > 0 AND "ADEP" IS NOT NULL
+  AND "FILED OFF BLOCK TIME" IS NOT NULL AND "FILED ARRIVAL TIME" IS NOT NULL
+GROUP BY ALL
+"""
+
+
+class DuckDBEngine:
+    """Aggregations as DuckDB SQL over the parquet partitions of a DatasetSource.
+
+    Files are listed from the source's manifest on every query, so batches
+    appended by an incremental ingest are picked up with the next refresh.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, source):
+        import duckdb
+
+        self._source = source
+        self._connection = duckdb.connect()
+
+    def _query(self, sql: str, files, **params) -> pd.DataFrame:
+        # Each thread queries through its own cursor on the shared database
+        cursor = self._connection.cursor()
+        try:
+            result = cursor.execute(sql, {"files": files, **params}).df()
+        finally:
+            cursor.close()
+        return self._source.normalize(result)
+
+    def delay_index(self) -> DelayIndex:
+        return DelayIndex(self._query(_DELAY_INDEX_SQL, self._source.files()))
+
+    def hourly_delays(self) -> HourlyDelays:
+        return HourlyDelays(self._query(_HOURLY_SQL, self._source.files()))
+
+    def slice_by_time(self, col, start, end, columns, days=None, closed="left") -> pd.DataFrame:
+        """Rows with ``col`` between ``start`` and ``end``, in the order the partitions hold them."""
+        select = f"SELECT {', '.join(_quote(c) for c in columns)} FROM read_parquet($files)"
+        files = self._source.files(days)
+        if not files:
+            # No rows, but the dataset's column types
+            return self._query(select + " LIMIT 0", self._source.files())
+        upper = "<=" if closed == "both" else "<"
+        sql = f"{select} WHERE {_quote(col)} >= $start AND {_quote(col)} {upper} $end"
+        return self._query(sql, files, start=_timestamp(start), end=_timestamp(end))
+
+
+class PolarsEngine:
+    """Aggregations as Polars lazy queries over the parquet partitions of a DatasetSource.
+
+    scan() exposes the partitions as a LazyFrame; the queries below only
+    materialize their aggregates.
+    """
+
+    name = "polars"
+
+    def __init__(self, source):
+        import polars
+
+        self._pl = polars
+        self._source = source
+
+    def scan(self, days=None):
+        """LazyFrame over the dataset's partitions, only those of ``days`` (first, last) if given."""
+        return self._pl.scan_parquet(self._source.files(days), hive_partitioning=False)
+
+    def _collect(self, query) -> pd.DataFrame:
+        return self._source.normalize(query.collect().to_pandas())
+
+    def _filed_day(self, col: str):
+        return self._pl.col(col).dt.truncate("1d")
+
+    def delay_index(self) -> DelayIndex:
+        pl = self._pl
+        delay = pl.col("DEPTDEL")
+        # Delays ceiled to whole minutes, as in the DuckDB engine's query
+        ceiled = (pl.when(delay > 0).then(delay.ceil().clip(upper_bound=MAX_THRESHOLD + 1))
+                  .otherwise(0.0).alias("DEPTDEL"))
+        query = (self.scan()
+                 .filter(pl.col("FILED OFF BLOCK TIME").is_not_null())
+                 .group_by(self._filed_day("FILED OFF BLOCK TIME"), ceiled,
+                           "ADEP", "AC Operator", "Country", "City")
+                 .agg(pl.len().alias("flights"),
+                      delay.count().alias("dep_count"), delay.sum().alias("dep_sum"),
+                      pl.col("ARVLDEL").count().alias("arr_count"),
+                      pl.col("ARVLDEL").sum().alias("arr_sum")))
+        return DelayIndex(self._collect(query))
+
+    def hourly_delays(self) -> HourlyDelays:
+        pl = self._pl
+        # Flights with both filed times, as HourlyDelays counts them
+        flights = self.scan().filter(*[pl.col(col).is_not_null() for col in FILED_TIMES])
+        parts = []
+        for measure, (time_col, hour_col) in HOURLY_MEASURES.items():
+            parts.append(flights
+                         .filter((pl.col(measure) > 0) & pl.col("ADEP").is_not_null())
+                         .group_by("ADEP", self._filed_day(time_col), hour_col)
+                         .agg(pl.col(measure).sum(), pl.len().alias("flights")))
+        return HourlyDelays(self._collect(pl.concat(parts, how="diagonal")))
+
+    def slice_by_time(self, col, start, end, columns, days=None, closed="left") -> pd.DataFrame:
+        """Rows with ``col`` between ``start`` and ``end``, in the order the partitions hold them."""
+        if not self._source.files(days):
+            # No rows, but the dataset's column types
+            return self._collect(self.scan().select(columns).head(0))
+        times = self._pl.col(col)
+        upper = times <= _timestamp(end) if closed == "both" else times < _timestamp(end)
+        query = self.scan(days).filter((times >= _timestamp(start)) & upper).select(columns)
+        return self._collect(query)
+
+
+_OPTIONAL_ENGINES = {"duckdb": DuckDBEngine, "polars": PolarsEngine}
+
+
+def open_engine(name: str, store, source):
+    """The engine called ``name`` for ``store``; pandas when the engine cannot serve ``source``."""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown query engine {name!r}; choose from {', '.join(ENGINES)}")
+    if name in _OPTIONAL_ENGINES and source.partitioned:
+        try:
+            return _OPTIONAL_ENGINES[name](source)
+        except ImportError:
+            log.warning("%s is not installed; using the pandas engine", name)
+    return PandasEngine(store)
@@ -0,0 +1,85 @@
+"""Dense airport x day x hour tensor of positive delays for the Comparison page.
+
+For every departure airport, filed day and hour of the 04-03 hour axis, the
+tensor holds the sum and count of the positive departure delays (by filed
+off-block time) and of the positive arrival delays (by filed arrival time),
+counting only flights with both filed times, as the Comparison page always has.
+An hourly profile for any (airport, day) is then one slice and a division,
+however many flights there are.
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from .schema import FILED_TIMES
+
+# Delay column -> filed time whose date it is counted on, and its hour-order column
+HOURLY_MEASURES = {
+    "DEPTDEL": ("FILED OFF BLOCK TIME", "DEP HOUR ORDER"),
+    "ARVLDEL": ("FILED ARRIVAL TIME", "ARR HOUR ORDER"),
+}
+HOURLY_COLUMNS = ["ADEP", "FILED OFF BLOCK TIME", "DEP HOUR ORDER", "DEPTDEL",
+                  "FILED ARRIVAL TIME", "ARR HOUR ORDER", "ARVLDEL"]
+
+# Hour orders run from 04 to 27 (03 of the next day, see schema.hour_order)
+HOUR_ORDERS = list(range(4, 28))
+
+_EPOCH = date(1970, 1, 1)
+
+
+class HourlyDelays:
+    """Sum and count of positive delays per (ADEP, filed day, hour order), per measure.
+
+    Built from the HOURLY_COLUMNS of the flight table; flights without an
+    airport or without both FILED_TIMES are left out. Rows pre-aggregated by a
+    query engine carry a ``flights`` column, and only flights with both filed
+    times; their delay is then the sum over that many flights.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        codes = frame["ADEP"].cat.codes.to_numpy()
+        observed = np.unique(codes[codes >= 0])
+        categories = frame["ADEP"].cat.categories
+        self._rows = {categories[code]: row for row, code in enumerate(observed)}
+        airport_rows = np.searchsorted(observed, codes)
+        n_airports = len(observed)
+        flights = frame["flights"].to_numpy() if "flights" in frame else None
+        filed = codes >= 0
+        if flights is None:
+            for col in FILED_TIMES:
+                filed &= frame[col].notna().to_numpy()
+
+        self._first_day: dict[str, int] = {}
+        self._sums: dict[str, np.ndarray] = {}
+        self._counts: dict[str, np.ndarray] = {}
+        for measure, (time_col, hour_col) in HOURLY_MEASURES.items():
+            day = frame[time_col].to_numpy(dtype="datetime64[D]")
+            delays = frame[measure].to_numpy(dtype=float)
+            keep = filed & ~np.isnat(day) & (delays > 0)
+            day = day[keep].astype(np.int64)
+            first_day = int(day.min()) if len(day) else 0
+            n_days = int(day.max()) - first_day + 1 if len(day) else 0
+            hour = frame[hour_col].to_numpy()[keep].astype(np.int64) - HOUR_ORDERS[0]
+            cell = (airport_rows[keep] * n_days + day - first_day) * len(HOUR_ORDERS) + hour
+            shape = (n_airports, n_days, len(HOUR_ORDERS))
+            size = n_airports * n_days * len(HOUR_ORDERS)
+            self._first_day[measure] = first_day
+            self._sums[measure] = np.bincount(cell, weights=delays[keep],
+                                              minlength=size).reshape(shape)
+            self._counts[measure] = np.bincount(
+                cell, weights=None if flights is None else flights[keep],
+                minlength=size).astype(np.int32).reshape(shape)
+
+    def profile(self, measure: str, airport: str, day: date) -> np.ndarray:
+        """Mean positive ``measure`` delay per hour of HOUR_ORDERS at ``airport`` on ``day``.
+
+        Hours without a positive delay are NaN.
+        """
+        sums, counts = self._sums[measure], self._counts[measure]
+        offset = (day - _EPOCH).days - self._first_day[measure]
+        row = self._rows.get(airport)
+        if row is None or not 0 <= offset < sums.shape[1]:
+            return np.full(len(HOUR_ORDERS), np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sums[row, offset] / counts[row, offset]
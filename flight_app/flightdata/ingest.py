@@ -0,0 +1,328 @@
+"""Convert the raw parquet exports into the optimized dataset the app loads.
+
+Run from the repository root:
+
+    python -m flight_app.flightdata                 # full rebuild
+    python -m flight_app.flightdata --incremental   # append new raw files only
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .cube import build_cube
+from .ipc import append_ipc, ipc_columns, open_ipc, write_ipc
+from .manifest import diff_files, file_entry, load_manifest, new_manifest, save_manifest
+from .monthly import build_daily_delays
+from .partitions import PARTITIONING, partition_keys
+from .rotations import ROTATION_COLS, ROTATION_INPUTS, follows, last_legs, link_rotations
+from .schema import (COMPUTED_COLS, TIME_COLS, add_derived, build_dictionaries,
+                     dimension_dtypes, encode_dimensions, parse_raw)
+from .sketches import build_sketches
+
+DATA_DIR = os.path.join("flight_app", "data")
+OPTIMIZED_DIR = os.path.join(DATA_DIR, "optimized")
+DATASET_PREFIX = "flights-"
+DICTIONARIES_FILE = "dictionaries.json"
+# Upper bound on the threads reading raw files at once
+MAX_READ_WORKERS = 8
+# Pre-aggregated tables written with every batch, by manifest key
+AGGREGATES = {"cube": build_cube, "daily": build_daily_delays, "sketch": build_sketches}
+
+
+def raw_files(path=DATA_DIR) -> list[str]:
+    return sorted(glob.glob(os.path.join(path, '*.parquet')))
+
+
+def _read_raw_table(path, columns) -> pa.Table:
+    table = pq.read_table(path, columns=columns)
+    # Saved pandas indexes are dropped, as ignore_index did for the pandas concat
+    index = [name for name in table.column_names if name.startswith("__index_level_")]
+    return table.drop_columns(index) if index else table
+
+
+def read_raw_tables(parquet_files, columns=None) -> pa.Table:
+    """Read the raw files concurrently into one table.
+
+    pyarrow releases the GIL while decoding, so the files are read on a
+    bounded thread pool; the tables are joined without copying.
+    """
+    workers = max(1, min(len(parquet_files), os.cpu_count() or 1, MAX_READ_WORKERS))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        tables = list(pool.map(lambda file: _read_raw_table(file, columns), parquet_files))
+    return pa.concat_tables(tables, promote_options="default")
+
+
+def read_raw_files(parquet_files, columns=None) -> pd.DataFrame:
+    """Read and parse the given raw parquet files.
+
+    With ``columns``, only the raw columns needed to produce them (plus the
+    timestamps every computed column depends on) are read, and the timestamps
+    are only parsed when a time or computed column is requested.
+    """
+    if not parquet_files:
+        return pd.DataFrame()
+    raw_columns, parse = None, True
+    if columns is not None:
+        raw_columns = [col for col in columns if col not in COMPUTED_COLS]
+        parse = len(raw_columns) < len(columns) or any(
+            col in TIME_COLS for col in columns)
+        if parse:
+            raw_columns = list(dict.fromkeys(raw_columns + TIME_COLS))
+    df = read_raw_tables(parquet_files, raw_columns).to_pandas(ignore_metadata=True)
+    if parse:
+        df = add_derived(parse_raw(df))
+    return df if columns is None else df[list(columns)]
+
+
+def read_raw(path=DATA_DIR, columns=None) -> pd.DataFrame:
+    """Read and parse every raw parquet file in ``path``."""
+    return read_raw_files(raw_files(path), columns)
+
+
+def raw_schema(path=DATA_DIR) -> list[str]:
+    """Columns available from the raw files once parsed and derived."""
+    parquet_files = raw_files(path)
+    if not parquet_files:
+        return []
+    names = pq.read_schema(parquet_files[0]).names
+    return [name for name in names
+            if name not in COMPUTED_COLS and not name.startswith("__index_level_")] + COMPUTED_COLS
+
+
+def dataset_path(manifest: dict, dest=OPTIMIZED_DIR) -> str:
+    """Directory of the partitioned dataset the manifest describes."""
+    return os.path.join(dest, DATASET_PREFIX + manifest["build"])
+
+
+def dictionaries_path(dest=OPTIMIZED_DIR) -> str:
+    return os.path.join(dest, DICTIONARIES_FILE)
+
+
+def load_dictionaries(dest=OPTIMIZED_DIR) -> dict[str, list[str]]:
+    """The shared category lists written alongside the dataset (empty if none)."""
+    path = dictionaries_path(dest)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_dictionaries(dictionaries: dict[str, list[str]], dest=OPTIMIZED_DIR):
+    tmp = dictionaries_path(dest) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dictionaries, f, ensure_ascii=False)
+    os.replace(tmp, dictionaries_path(dest))
+
+
+def write_dataset(df: pd.DataFrame, path: str, batch=0) -> list[str]:
+    """Write ``df`` into the year/month/day hive-partitioned dataset at ``path``.
+
+    Files are named after ``batch`` so appends never overwrite earlier ones.
+    Returns the written files relative to ``path``.
+    """
+    written = []
+    table = pa.Table.from_pandas(partition_keys(df), preserve_index=False)
+    # One partition per filed day, plus one for flights without a filed time;
+    # pyarrow refuses more than 1024 unless told otherwise
+    days = df["FILED OFF BLOCK TIME"].dt.normalize().nunique() + 1
+    ds.write_dataset(table, path, format="parquet", partitioning=PARTITIONING,
+                     basename_template=f"part-{batch}-{{i}}.parquet",
+                     max_partitions=max(days, 1024),
+                     existing_data_behavior="overwrite_or_ignore",
+                     file_visitor=lambda f: written.append(os.path.relpath(f.path, path)))
+    return sorted(written)
+
+
+def write_batch(df: pd.DataFrame, path: str, batch=0) -> tuple[list[str], dict]:
+    """Write one batch as dataset partitions and its aggregates.
+
+    Returns the partition files and the file of each of AGGREGATES, relative
+    to ``path``.
+    """
+    fragments = write_dataset(df, path, batch=batch)
+    aggregates = {}
+    for kind, build in AGGREGATES.items():
+        aggregates[kind] = f"{kind}-{batch}.parquet"
+        pq.write_table(pa.Table.from_pandas(build(df), preserve_index=False),
+                       os.path.join(path, aggregates[kind]))
+    return fragments, aggregates
+
+
+def cache_files(manifest: dict) -> list[str] | None:
+    """The IPC copies holding every batch of ``manifest`` in row order, relative to its dataset.
+
+    Builds since the copy is kept whole have one; older builds one per batch.
+    None for builds without IPC copies.
+    """
+    if manifest.get("cache"):
+        return [manifest["cache"]]
+    batches = manifest["batches"]
+    if batches and all(batch.get("cache") for batch in batches):
+        return [batch["cache"] for batch in batches]
+    return None
+
+
+def _cache_name(batch) -> str:
+    return f"cache-{batch}.arrow"
+
+
+def _batch_entry(batch, names, written, df) -> dict:
+    fragments, aggregates = written
+    filed = df["FILED OFF BLOCK TIME"].dropna()
+    return {
+        "id": batch,
+        "files": names,
+        "fragments": fragments,
+        **aggregates,
+        "rows": len(df),
+        # Filed-date range the batch touches; stores invalidate aggregates over it
+        "first_day": filed.min().date().isoformat() if len(filed) else None,
+        "last_day": filed.max().date().isoformat() if len(filed) else None,
+    }
+
+
+def _encode(df, dest):
+    # Keep the codes of values seen by earlier ingests stable
+    dictionaries = build_dictionaries(df, load_dictionaries(dest))
+    # Dictionaries only grow, so publishing them first is safe for readers
+    save_dictionaries(dictionaries, dest)
+    return encode_dimensions(df, dictionaries)
+
+
+def _rebuild(paths, dest) -> dict:
+    df = read_raw_files(paths)
+    os.makedirs(dest, exist_ok=True)
+    df = _encode(df, dest)
+    df = df.join(link_rotations(df))
+    previous = load_manifest(dest)
+    manifest = new_manifest()
+    # Each build gets its own directory; the manifest swap publishes it
+    written = write_batch(df, dataset_path(manifest, dest), batch=0)
+    names = [os.path.basename(path) for path in paths]
+    manifest["files"] = {os.path.basename(path): file_entry(path) for path in paths}
+    manifest["batches"] = [_batch_entry(0, names, written, df)]
+    manifest["cache"] = _cache_name(0)
+    write_ipc(df, os.path.join(dataset_path(manifest, dest), manifest["cache"]))
+    save_manifest(manifest, dest)
+    # Keep the previous build for stores that have not reloaded yet
+    keep = {dataset_path(manifest, dest)}
+    if previous is not None:
+        keep.add(dataset_path(previous, dest))
+    for path in glob.glob(os.path.join(dest, DATASET_PREFIX + "*")):
+        if path not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+    return {"rows": len(df), "files": len(paths), "rebuilt": True}
+
+
+def _cached_tables(manifest, dest) -> list | None:
+    # The mapped IPC copies of every stored row; None for builds without them
+    # or without rotation chains
+    files = cache_files(manifest)
+    if files is None:
+        return None
+    base = dataset_path(manifest, dest)
+    tables = [open_ipc(os.path.join(base, name)) for name in files]
+    if not all(set(ROTATION_COLS) <= set(table.schema.names) for table in tables):
+        return None
+    return tables
+
+
+def _history(tables, dest) -> tuple[pd.DataFrame, int]:
+    # Each aircraft's latest stored leg and the number of stored rows
+    dtypes = dimension_dtypes(load_dictionaries(dest))
+    flights = pd.concat([ipc_columns(table, ROTATION_INPUTS, dtypes) for table in tables],
+                        ignore_index=True)
+    return last_legs(flights), len(flights)
+
+
+def _remove_caches(base, keep):
+    # Stores that have not polled yet may still map the previous copy, and
+    # some platforms refuse to delete a mapped file; it goes on a later append
+    for path in glob.glob(os.path.join(base, "*.arrow")):
+        if os.path.basename(path) not in keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _append(paths, manifest, dest) -> dict | None:
+    # None when the new flights cannot be linked onto the stored rotation chains
+    df = _encode(read_raw_files(paths), dest)
+    tables = _cached_tables(manifest, dest)
+    if tables is None:
+        return None
+    history = _history(tables, dest)
+    if not follows(history[0], df):
+        return None
+    df = df.join(link_rotations(df, *history))
+    base = dataset_path(manifest, dest)
+    batch = max(entry["id"] for entry in manifest["batches"]) + 1
+    written = write_batch(df, base, batch=batch)
+    # The IPC copy is rewritten whole, so readers keep mapping one contiguous file
+    previous = cache_files(manifest)
+    append_ipc(tables, df, os.path.join(base, _cache_name(batch)))
+    del tables
+    names = [os.path.basename(path) for path in paths]
+    manifest["files"].update(
+        {os.path.basename(path): file_entry(path) for path in paths})
+    manifest["batches"].append(_batch_entry(batch, names, written, df))
+    manifest["cache"] = _cache_name(batch)
+    save_manifest(manifest, dest)
+    _remove_caches(base, {manifest["cache"], *previous})
+    return {"rows": len(df), "files": len(paths), "rebuilt": False}
+
+
+def ingest(source=DATA_DIR, dest=OPTIMIZED_DIR, incremental=False) -> dict:
+    """Build the optimized dataset in ``dest`` from the raw files in ``source``.
+
+    With ``incremental``, only raw files missing from the manifest are parsed
+    and appended as a new batch. A full rebuild still happens when there is no
+    dataset yet, an already ingested file changed or disappeared, or a new
+    flight leaves before its aircraft's last stored leg (see rotations.py).
+    """
+    paths = raw_files(source)
+    if not paths:
+        raise FileNotFoundError(f"No parquet files found in {source}")
+    manifest = load_manifest(dest)
+    if incremental and manifest is not None and os.path.isdir(dataset_path(manifest, dest)):
+        new, changed = diff_files(manifest["files"], paths)
+        if not changed:
+            if not new:
+                save_manifest(manifest, dest)
+                return {"rows": 0, "files": 0, "rebuilt": False}
+            by_name = {os.path.basename(path): path for path in paths}
+            result = _append([by_name[name] for name in new], manifest, dest)
+            if result is not None:
+                return result
+            print("New flights cannot be linked onto the stored rotation chains; rebuilding")
+        else:
+            print(f"{len(changed)} ingested file(s) changed or disappeared; rebuilding")
+    return _rebuild(paths, dest)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m flight_app.flightdata",
+                                     description=__doc__.splitlines()[0])
+    parser.add_argument("--source", default=DATA_DIR,
+                        help="directory holding the raw *.parquet exports")
+    parser.add_argument("--dest", default=OPTIMIZED_DIR,
+                        help="output directory for the optimized dataset")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only parse raw files not ingested before")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    result = ingest(args.source, args.dest, incremental=args.incremental)
+    action = "Rebuilt dataset with" if result["rebuilt"] else "Appended"
+    print(f"{action} {result['rows']} flights from {result['files']} file(s) "
+          f"in {args.dest} in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,85 @@
+"""Memory-mapped Arrow IPC copy of the ingested flights.
+
+Ingest also writes the whole flight table as one uncompressed Arrow IPC file
+with a single record batch, rewritten with the new rows on every append.
+Opening it with a memory map costs nothing up front, and the columns handed
+to pandas are read-only views into the map, so every Streamlit process on
+the host shares the one copy held in the OS page cache.
+
+To keep those views free of copies, no column carries a validity bitmap:
+missing floats are stored as NaN, missing timestamps as NaT (int64 min) and
+categoricals as their integer codes (-1 for missing) against the shared
+dictionaries. Strings and bools have no zero-copy numpy form (Arrow packs
+bools into bits) and are copied when read.
+"""
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+
+def _plain_array(values: pd.Series) -> pa.Array:
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return pa.array(values.cat.codes.to_numpy())
+    if pd.api.types.is_datetime64_any_dtype(values):
+        ns = values.to_numpy(dtype="datetime64[ns]").view("i8")
+        return pa.array(ns).view(pa.timestamp("ns"))
+    if values.dtype.kind in "biuf":
+        return pa.array(values.to_numpy(), from_pandas=False)
+    return pa.array(values, from_pandas=True)
+
+
+def _zero_copy(type_: pa.DataType) -> bool:
+    return pa.types.is_integer(type_) or pa.types.is_floating(type_) or pa.types.is_timestamp(type_)
+
+
+def _ipc_table(df: pd.DataFrame) -> pa.Table:
+    return pa.table({col: _plain_array(df[col]) for col in df.columns})
+
+
+def _write_table(table: pa.Table, path: str):
+    tmp = path + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+    os.replace(tmp, path)
+
+
+def write_ipc(df: pd.DataFrame, path: str):
+    """Write ``df`` to ``path`` as one uncompressed record batch."""
+    _write_table(_ipc_table(df), path)
+
+
+def append_ipc(tables, df: pd.DataFrame, path: str):
+    """Write the rows of ``tables`` followed by ``df`` to ``path`` as one record batch.
+
+    The rows are combined into contiguous buffers first, so readers map every
+    column as a single view. Code columns widen when the dictionaries outgrew
+    their type.
+    """
+    table = pa.concat_tables([*tables, _ipc_table(df)], promote_options="permissive")
+    _write_table(table.combine_chunks(), path)
+
+
+def open_ipc(path: str) -> pa.Table:
+    """Memory-map ``path``; the table's buffers keep the map open."""
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def ipc_columns(table: pa.Table, columns, dtypes) -> pd.DataFrame:
+    """Columns of a mapped table as pandas columns viewing the mapped memory.
+
+    ``dtypes`` gives the categorical dtype of each code column.
+    """
+    data = {}
+    for col in columns:
+        chunked = table.column(col)
+        array = chunked.chunk(0) if chunked.num_chunks == 1 else chunked.combine_chunks()
+        if array.null_count or not _zero_copy(array.type):
+            data[col] = array.to_pandas()  # strings, bools and nulls; copies
+            continue
+        values = array.to_numpy(zero_copy_only=True)
+        if col in dtypes:
+            values = pd.Categorical.from_codes(values, dtype=dtypes[col], validate=False)
+        data[col] = pd.Series(values, name=col, copy=False)
+    return pd.DataFrame(data, copy=False)
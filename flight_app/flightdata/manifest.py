@@ -0,0 +1,78 @@
+"""Bookkeeping of which raw files the optimized dataset was built from.
+
+``manifest.json`` sits next to the dataset and records, for every raw file,
+its size, mtime and SHA-256, plus the batches of partition files each ingest
+run appended. The store watches it to pick up new batches without a reload.
+"""
+import hashlib
+import json
+import os
+import uuid
+
+MANIFEST_FILE = "manifest.json"
+
+
+def manifest_path(dest: str) -> str:
+    return os.path.join(dest, MANIFEST_FILE)
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_entry(path: str, with_hash=True) -> dict:
+    stat = os.stat(path)
+    entry = {"size": stat.st_size, "mtime": stat.st_mtime}
+    if with_hash:
+        entry["sha256"] = file_hash(path)
+    return entry
+
+
+def new_manifest() -> dict:
+    # A fresh build id tells running stores to reload instead of appending
+    return {"build": uuid.uuid4().hex, "files": {}, "batches": []}
+
+
+def load_manifest(dest: str) -> dict | None:
+    path = manifest_path(dest)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, dest: str):
+    tmp = manifest_path(dest) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, manifest_path(dest))
+
+
+def diff_files(known: dict, paths: list[str], with_hash=True):
+    """Split ``paths`` against the ``known`` entries (keyed by file name).
+
+    Returns ``(new, changed)``: names not seen before, and known names whose
+    file is gone or whose content differs. A file whose size and mtime are
+    unchanged is trusted without hashing; one that was only touched (same
+    hash) has its mtime refreshed in ``known``.
+    """
+    by_name = {os.path.basename(path): path for path in paths}
+    new = [name for name in by_name if name not in known]
+    changed = []
+    for name, entry in known.items():
+        path = by_name.get(name)
+        if path is None:
+            changed.append(name)
+            continue
+        current = file_entry(path, with_hash=False)
+        if current["size"] == entry["size"] and current["mtime"] == entry["mtime"]:
+            continue
+        if with_hash and current["size"] == entry["size"] and file_hash(path) == entry.get("sha256"):
+            entry["mtime"] = current["mtime"]
+            continue
+        changed.append(name)
+    return sorted(new), sorted(changed)
@@ -0,0 +1,79 @@
+"""Per-airport daily delay aggregates behind the Comparison page's Monthly mode.
+
+For every departure airport, month and day of the month, ingest stores the
+sum and count of the positive departure delays (on the filed off-block date)
+and of the positive arrival delays (on the filed arrival date), counting only
+flights with both filed times, as the Comparison page always has. Ingest writes
+one file per batch; rows of different batches simply add up. The store lays
+them out as a dense airport x month x day matrix, so a month's daily means
+for an airport are one slice and a division.
+"""
+import numpy as np
+import pandas as pd
+
+from .schema import FILED_TIMES
+
+MONTHLY_KEYS = ["ADEP", "MONTH", "DAY"]
+# Delay column -> column prefix of its aggregates, and its month / day columns
+MONTHLY_MEASURES = {
+    "DEPTDEL": ("dep", "DEP MONTH", "DEP DAY"),
+    "ARVLDEL": ("arr", "ARR MONTH", "ARR DAY"),
+}
+# Flight columns the aggregates are built from
+MONTHLY_COLUMNS = ["ADEP", "DEPTDEL", "DEP MONTH", "DEP DAY",
+                   "ARVLDEL", "ARR MONTH", "ARR DAY", *FILED_TIMES]
+
+MONTHS, DAYS = 12, 31
+
+
+def build_daily_delays(df: pd.DataFrame) -> pd.DataFrame:
+    """Aggregate flights into one row per (ADEP, MONTH, DAY) with a positive delay.
+
+    Each measure's ``<prefix>_sum`` and ``<prefix>_count`` cover its positive
+    delays only; flights without an airport or without both FILED_TIMES are
+    left out.
+    """
+    df = df.dropna(subset=FILED_TIMES)
+    parts = []
+    for col, (prefix, month, day) in MONTHLY_MEASURES.items():
+        rows = df[df[col] > 0]
+        keys = [rows["ADEP"], rows[month].rename("MONTH"), rows[day].rename("DAY")]
+        parts.append(rows.groupby(keys, observed=True)[col]
+                     .agg(**{f"{prefix}_sum": "sum", f"{prefix}_count": "count"}))
+    daily = pd.concat(parts, axis=1).fillna(0).reset_index()
+    counts = [f"{prefix}_count" for prefix, _, _ in MONTHLY_MEASURES.values()]
+    return daily.astype({col: np.int64 for col in counts})
+
+
+class MonthlyDelays:
+    """Dense (airport, month, day of month) sums and counts of positive delays.
+
+    Built from the rows of build_daily_delays(), of one or several batches.
+    """
+
+    def __init__(self, rows: pd.DataFrame):
+        codes = rows["ADEP"].cat.codes.to_numpy()
+        observed = np.unique(codes)
+        categories = rows["ADEP"].cat.categories
+        self._rows = {categories[code]: row for row, code in enumerate(observed)}
+        cell = ((np.searchsorted(observed, codes) * MONTHS + rows["MONTH"].to_numpy(np.int64) - 1)
+                * DAYS + rows["DAY"].to_numpy(np.int64) - 1)
+        shape = (len(observed), MONTHS, DAYS)
+        self._sums: dict[str, np.ndarray] = {}
+        self._counts: dict[str, np.ndarray] = {}
+        for measure, (prefix, _, _) in MONTHLY_MEASURES.items():
+            self._sums[measure] = np.bincount(cell, weights=rows[f"{prefix}_sum"].to_numpy(float),
+                                              minlength=np.prod(shape)).reshape(shape)
+            self._counts[measure] = np.bincount(cell, weights=rows[f"{prefix}_count"].to_numpy(float),
+                                                minlength=np.prod(shape)).reshape(shape)
+
+    def profile(self, measure: str, airport: str, month: int) -> np.ndarray:
+        """Mean positive ``measure`` delay at ``airport`` on days 1..31 of ``month``.
+
+        Days without a positive delay (or past the end of the month) are NaN.
+        """
+        row = self._rows.get(airport)
+        if row is None:
+            return np.full(DAYS, np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self._sums[measure][row, month - 1] / self._counts[measure][row, month - 1]
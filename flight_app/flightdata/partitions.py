@@ -0,0 +1,48 @@
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# The optimized dataset is hive-partitioned (year=/month=/day=) on the filed
+# off-block date. Flights without a filed time go to year=-1/month=-1/day=-1.
+PARTITION_COLS = ["year", "month", "day"]
+PARTITIONING = ds.partitioning(
+    pa.schema([("year", pa.int16()), ("month", pa.int8()), ("day", pa.int8())]),
+    flavor="hive")
+
+
+def partition_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """``df`` with the year/month/day partition columns added."""
+    filed = df["FILED OFF BLOCK TIME"].dt
+    return df.assign(
+        year=filed.year.fillna(-1).to_numpy(dtype=np.int16),
+        month=df["DEP MONTH"].to_numpy(dtype=np.int8),
+        day=df["DEP DAY"].to_numpy(dtype=np.int8),
+    )
+
+
+def days_between(first: date, last: date) -> list[date]:
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+
+def partition_dir(day: date) -> str:
+    """Directory of ``day``'s partition, relative to the dataset root."""
+    return os.path.join(*(f"{col}={value}" for col, value in
+                          zip(PARTITION_COLS, (day.year, day.month, day.day))))
+
+
+def day_filter(first: date, last: date) -> ds.Expression:
+    """Dataset filter matching the partitions for ``first``..``last`` inclusive.
+
+    Written as one equality conjunction per day so pyarrow can prune every
+    other partition directory without opening it.
+    """
+    expr = None
+    for day in days_between(first, last):
+        match = ((ds.field("year") == day.year) & (ds.field("month") == day.month)
+                 & (ds.field("day") == day.day))
+        expr = match if expr is None else expr | match
+    return expr if expr is not None else ds.scalar(False)
@@ -0,0 +1,103 @@
+"""Reactionary delay tracing along the aircraft rotation chains (see rotations.py).
+
+A departure inherits the part of its inbound leg's arrival delay that the
+scheduled ground time cannot absorb: ground time beyond MIN_TURNAROUND is
+slack, and the rest of the inbound delay (capped at the departure delay) is
+inherited. What is left of the departure delay was generated locally.
+
+Inherited minutes are followed back leg by leg. An inbound leg's arrival
+delay is its departure delay plus time lost en route, so inherited minutes
+are split between the two in proportion; the departure share is split again
+into local and inherited minutes, and so on. Every step is one gather over
+all traced departures at once.
+"""
+import numpy as np
+import pandas as pd
+
+# Minutes an aircraft needs on the ground between two legs; scheduled ground
+# time beyond it absorbs inbound delay
+MIN_TURNAROUND = 30
+# Flight columns the tracer reads
+PROPAGATION_COLUMNS = ["PREV LEG", "DEPTDEL", "ARVLDEL", "FILED OFF BLOCK TIME",
+                       "FILED ARRIVAL TIME", "ACTUAL ARRIVAL TIME"]
+# Minutes per hop: attributed at the departure, generated there, passed on to
+# its inbound leg, lost on that leg en route, and passed on past the traced legs
+FLOWS = ["delay", "local", "inherited", "en_route", "untraced"]
+
+
+def inherited_delay(delay, inbound_delay, ground_time, min_turnaround=MIN_TURNAROUND) -> np.ndarray:
+    """Minutes of each departure ``delay`` inherited from its inbound leg.
+
+    ``ground_time`` is the scheduled time between the inbound leg's filed
+    arrival and the departure's filed off-block, in minutes; missing values
+    count as no inbound delay and no slack.
+    """
+    slack = np.maximum(np.nan_to_num(ground_time) - min_turnaround, 0)
+    inherited = np.nan_to_num(inbound_delay) - slack
+    return np.clip(inherited, 0, np.maximum(np.nan_to_num(delay), 0))
+
+
+def _minutes(later: np.ndarray, earlier: np.ndarray) -> np.ndarray:
+    return (later - earlier) / np.timedelta64(1, "m")
+
+
+class DelayPropagation:
+    """Whole-table arrays of PROPAGATION_COLUMNS, in table row order."""
+
+    def __init__(self, flights: pd.DataFrame):
+        self._prev = flights["PREV LEG"].to_numpy(dtype=np.int64)
+        self._delay = flights["DEPTDEL"].to_numpy(dtype=float)
+        self._arrival_delay = flights["ARVLDEL"].to_numpy(dtype=float)
+        self._filed_off = flights["FILED OFF BLOCK TIME"].to_numpy(dtype="datetime64[ns]")
+        self._filed_arrival = flights["FILED ARRIVAL TIME"].to_numpy(dtype="datetime64[ns]")
+        self._arrival = flights["ACTUAL ARRIVAL TIME"].to_numpy(dtype="datetime64[ns]")
+        self.size = len(flights)
+
+    def trace(self, departures: pd.DataFrame, hops: int, since,
+              min_turnaround=MIN_TURNAROUND) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Attribute the positive DEPTDEL of ``departures`` along their rotation chains.
+
+        ``departures`` needs PREV LEG, DEPTDEL and FILED OFF BLOCK TIME. At most
+        ``hops`` inbound legs are followed, and only legs that arrived at or
+        after ``since``. Returns the local and inherited minutes of each
+        departure (LOCAL DELAY, INHERITED DELAY) with the number of legs its
+        inherited minutes were followed through (HOPS), and the FLOWS summed
+        per hop (0 is the departures themselves).
+        """
+        prev = departures["PREV LEG"].to_numpy(dtype=np.int64)
+        delay = departures["DEPTDEL"].to_numpy(dtype=float)
+        filed_off = departures["FILED OFF BLOCK TIME"].to_numpy(dtype="datetime64[ns]")
+        since = np.datetime64(pd.Timestamp(since).to_datetime64(), "ns")
+        # Minutes of each traced departure's delay still being attributed
+        share = root = np.maximum(np.nan_to_num(delay), 0)
+        traced = np.arange(len(prev))
+        hop_count = np.zeros(len(prev), dtype=np.int64)
+        local_root = root
+        flows = np.zeros((hops + 1, len(FLOWS)))
+
+        for hop in range(hops + 1):
+            linked = prev >= 0
+            rows = np.where(linked, prev, 0)
+            ground = np.where(linked, _minutes(filed_off, self._filed_arrival[rows]), np.nan)
+            inbound = np.where(linked, self._arrival_delay[rows], np.nan)
+            inherited = inherited_delay(delay, inbound, ground, min_turnaround)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                passed = np.where(delay > 0, share * inherited / delay, 0.0)
+            if hop == 0:
+                local_root = share - passed
+            flows[hop, :3] = share.sum(), (share - passed).sum(), passed.sum()
+
+            # Follow the inherited minutes onto the inbound legs still in range
+            follow = (passed > 0) & (hop < hops) & (self._arrival[rows] >= since)
+            flows[hop, 4] = passed[~follow].sum()
+            rows, passed, traced = rows[follow], passed[follow], traced[follow]
+            hop_count[traced] += 1
+            arrival_delay = self._arrival_delay[rows]
+            departed = np.clip(np.nan_to_num(self._delay[rows]), 0, arrival_delay)
+            share = passed * departed / arrival_delay
+            flows[hop, 3] = (passed - share).sum()
+            prev, delay, filed_off = self._prev[rows], self._delay[rows], self._filed_off[rows]
+
+        attribution = pd.DataFrame({"LOCAL DELAY": local_root, "INHERITED DELAY": root - local_root,
+                                    "HOPS": hop_count}, index=departures.index)
+        return attribution, pd.DataFrame(flows, columns=FLOWS).rename_axis("hop")
@@ -0,0 +1,33 @@
+"""Top-N selection for the pages' ranking tables and charts.
+
+The delay counts themselves come from the delay index; these kernels pick the
+top rows with a partial partition instead of sorting the whole table.
+"""
+import numpy as np
+import pandas as pd
+
+
+def top_n(values: np.ndarray, n: int) -> np.ndarray:
+    """Positions of the ``n`` largest values, largest first.
+
+    Equal values keep their original order and missing values rank last, as
+    with a stable ``sort_values(ascending=False)``. Only the candidates at or
+    above the n-th largest value are sorted.
+    """
+    values = np.where(np.isnan(values), -np.inf, values) if values.dtype.kind == "f" else values
+    n = max(0, min(n, len(values)))
+    if n == 0:
+        return np.empty(0, dtype=np.intp)
+    if n < len(values):
+        nth = values[np.argpartition(values, len(values) - n)[len(values) - n]]
+        candidates = np.flatnonzero(values >= nth)
+    else:
+        candidates = np.arange(len(values))
+    order = np.argsort(-values[candidates], kind="stable")
+    return candidates[order[:n]]
+
+
+def top_rows(table: pd.DataFrame, column: str, n: int | None = None) -> pd.DataFrame:
+    """The ``n`` rows of ``table`` with the largest ``column`` (all rows if None), largest first."""
+    n = len(table) if n is None else n
+    return table.iloc[top_n(table[column].to_numpy(), n)]
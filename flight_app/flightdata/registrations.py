@@ -0,0 +1,48 @@
+"""Flights grouped by aircraft registration, for per-aircraft time lookups.
+
+The index is laid out like a CSR matrix: the flight table's row positions,
+sorted by registration and then by one time column, plus each registration's
+offset into them. An aircraft's flights in a time range are then its
+contiguous run of rows, cut down by two binary searches on the time column.
+"""
+import numpy as np
+import pandas as pd
+
+
+class RegistrationIndex:
+    """Row positions of each registration's flights, sorted by ``times``.
+
+    Flights without a registration or a time are left out.
+    """
+
+    def __init__(self, registrations: pd.Series, times: pd.Series):
+        codes = registrations.cat.codes.to_numpy()
+        values = times.to_numpy(dtype="datetime64[ns]")
+        stamps = values.view(np.int64)
+        rows = np.flatnonzero((codes >= 0) & ~np.isnat(values))
+        # lexsort is stable: equal times keep their table order
+        self._rows = rows[np.lexsort((stamps[rows], codes[rows]))]
+        self._times = stamps[self._rows]
+        counts = np.bincount(codes[self._rows], minlength=len(registrations.cat.categories))
+        self._offsets = np.concatenate([[0], np.cumsum(counts)])
+        self._categories = registrations.cat.categories
+        self.size = len(registrations)
+
+    def rows(self, registrations, start, end, closed="left") -> np.ndarray:
+        """Table positions of the ``registrations``' flights with a time in ``start``..``end``.
+
+        ``closed`` is "left" for ``start <= time < end`` or "both" for
+        ``start <= time <= end``. Positions come back in table order.
+        """
+        lo_time, hi_time = pd.Timestamp(start).value, pd.Timestamp(end).value
+        found = []
+        for registration in set(registrations):
+            if registration not in self._categories:
+                continue
+            code = self._categories.get_loc(registration)
+            first, last = self._offsets[code], self._offsets[code + 1]
+            times = self._times[first:last]
+            lo = np.searchsorted(times, lo_time, side="left")
+            hi = np.searchsorted(times, hi_time, side="right" if closed == "both" else "left")
+            found.append(self._rows[first + lo:first + max(lo, hi)])
+        return np.sort(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
@@ -0,0 +1,101 @@
+"""Aircraft rotation chains: each flight linked to the same aircraft's previous leg.
+
+Legs are ordered by registration and actual off-block time. Every flight
+stores the table row of its aircraft's previous leg (PREV LEG, -1 if none),
+the minutes between that leg's actual arrival and its own actual off-block
+(TURNAROUND) and that leg's arrival delay (INBOUND DELAY). Rows count across
+the whole table in load order, so a chain is followed by indexing PREV LEG
+with itself. Flights without a registration or an actual off-block time are
+not linked.
+"""
+import numpy as np
+import pandas as pd
+
+# Flight columns the chains are built from
+ROTATION_INPUTS = ["AC Registration", "ACTUAL OFF BLOCK TIME", "ACTUAL ARRIVAL TIME", "ARVLDEL"]
+# Columns stored for every flight
+ROTATION_COLS = ["PREV LEG", "TURNAROUND", "INBOUND DELAY"]
+
+
+def _codes(registrations: pd.Series) -> np.ndarray:
+    if isinstance(registrations.dtype, pd.CategoricalDtype):
+        return registrations.cat.codes.to_numpy(dtype=np.int64)
+    return pd.factorize(registrations)[0].astype(np.int64)
+
+
+def _legs(df: pd.DataFrame, offset=0) -> dict[str, np.ndarray]:
+    # Linkable legs of ``df`` as arrays, with their table rows
+    codes = _codes(df["AC Registration"])
+    off_block = df["ACTUAL OFF BLOCK TIME"].to_numpy(dtype="datetime64[ns]")
+    keep = np.flatnonzero((codes >= 0) & ~np.isnat(off_block))
+    return {
+        "row": keep + offset,
+        "code": codes[keep],
+        "off_block": off_block[keep],
+        "arrival": df["ACTUAL ARRIVAL TIME"].to_numpy(dtype="datetime64[ns]")[keep],
+        "delay": df["ARVLDEL"].to_numpy(dtype=float)[keep],
+    }
+
+
+def _chain(legs: dict[str, np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    # Legs in rotation order, and the position of each one's previous leg (-1 if none);
+    # lexsort is stable, so equal times keep their table order
+    order = np.lexsort((legs["off_block"], legs["code"]))
+    codes = legs["code"][order]
+    previous = np.arange(-1, len(order) - 1)
+    previous[1:][codes[1:] != codes[:-1]] = -1
+    return order, previous
+
+
+def last_legs(df: pd.DataFrame, offset=0) -> pd.DataFrame:
+    """Each aircraft's latest leg in ``df`` with its table row (ROW), for linking later batches."""
+    legs = _legs(df, offset)
+    order, previous = _chain(legs)
+    # A leg is its aircraft's latest when the next one in rotation order starts another aircraft
+    latest = legs["row"][order[np.append(previous[1:] < 0, True)]] if len(order) else []
+    last = df[ROTATION_INPUTS].take(np.asarray(latest, dtype=np.int64) - offset)
+    return last.reset_index(drop=True).assign(ROW=latest)
+
+
+def follows(history: pd.DataFrame, df: pd.DataFrame) -> bool:
+    """Whether every leg in ``df`` leaves no earlier than its aircraft's leg in ``history``.
+
+    ``history`` holds last_legs() of the flights before ``df``; both must be
+    coded against the same registration categories.
+    """
+    legs = _legs(df)
+    known = _legs(history)
+    latest = np.full(len(df["AC Registration"].cat.categories), np.datetime64("NaT"),
+                     dtype="datetime64[ns]")
+    latest[known["code"]] = known["off_block"]
+    before = latest[legs["code"]]
+    return not np.any(~np.isnat(before) & (legs["off_block"] < before))
+
+
+def link_rotations(df: pd.DataFrame, history: pd.DataFrame | None = None, offset=0) -> pd.DataFrame:
+    """ROTATION_COLS for the flights of ``df``, whose first row is table row ``offset``.
+
+    ``history`` (last_legs() of the earlier rows) links each aircraft's first
+    leg in ``df`` back to them.
+    """
+    legs = _legs(df, offset)
+    if history is not None and len(history):
+        earlier = _legs(history)
+        earlier["row"] = history["ROW"].to_numpy()[earlier["row"]]
+        legs = {key: np.concatenate([earlier[key], legs[key]]) for key in legs}
+    order, previous = _chain(legs)
+    linked = order[previous >= 0]
+    inbound = order[previous[previous >= 0]]
+    # Only the legs of ``df`` get links; history legs come first in rotation order ties
+    mine = legs["row"][linked] >= offset
+    linked, inbound = linked[mine], inbound[mine]
+    rows = legs["row"][linked] - offset
+
+    prev_leg = np.full(len(df), -1, dtype=np.int64)
+    turnaround = np.full(len(df), np.nan)
+    inbound_delay = np.full(len(df), np.nan)
+    prev_leg[rows] = legs["row"][inbound]
+    turnaround[rows] = (legs["off_block"][linked] - legs["arrival"][inbound]) / np.timedelta64(1, "m")
+    inbound_delay[rows] = legs["delay"][inbound]
+    return pd.DataFrame({"PREV LEG": prev_leg, "TURNAROUND": turnaround,
+                         "INBOUND DELAY": inbound_delay}, index=df.index)
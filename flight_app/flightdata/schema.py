@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+
+# Raw Eurocontrol exports store timestamps as strings in this format
+DATE_FORMAT = "%d-%m-%Y %H:%M:%S"
+TIME_COLS = ["FILED OFF BLOCK TIME", "ACTUAL OFF BLOCK TIME",
+             "FILED ARRIVAL TIME", "ACTUAL ARRIVAL TIME"]
+# The Comparison page's delay averages leave out flights missing either filed time
+FILED_TIMES = ["FILED OFF BLOCK TIME", "FILED ARRIVAL TIME"]
+
+# Overview's default departure delay brackets (lower edges in minutes)
+DELAY_BRACKET_EDGES = [15, 30, 90]
+DELAY_BRACKET_LABELS = ["0-15", "15-30", "30-90", "90+"]
+
+DELAY_BRACKET_DTYPE = pd.CategoricalDtype(DELAY_BRACKET_LABELS, ordered=True)
+# Edges the Overview's brackets can be built from. The cube keeps each delay's
+# bin on these, so any subset rebins without touching the flights.
+BRACKET_EDGE_CHOICES = [5, 10, 15, 20, 30, 45, 60, 90, 120, 180]
+
+# Categorical columns and the categories they are always exposed with
+CATEGORICAL_DTYPES = {"Delay Bracket": DELAY_BRACKET_DTYPE}
+
+# Repeated string dimensions, stored as categoricals. Columns naming the same
+# kind of entity share one dictionary, so an ADES code means the same airport
+# as the equal ADEP code.
+DIMENSIONS = {
+    "ADEP": "airport",
+    "ADES": "airport",
+    "AC Operator": "operator",
+    "AC Registration": "registration",
+    "AC Type": "aircraft_type",
+    "City": "city",
+    "Country": "country",
+}
+
+# Calendar parts derived from the filed departure / arrival times. Missing
+# timestamps are stored as -1 so the columns stay plain int8.
+DERIVED_COLS = ["DEP HOUR", "DEP DAY", "DEP MONTH", "DEP HOUR ORDER",
+                "ARR HOUR", "ARR DAY", "ARR MONTH", "ARR HOUR ORDER",
+                "Delay Bracket"]
+
+# Columns computed by parse_raw/add_derived rather than read from the raw exports
+COMPUTED_COLS = ["DEPTDEL", "ARVLDEL"] + DERIVED_COLS
+
+# Columns each page reads; the loader only pulls these from parquet
+PAGE_COLUMNS = {
+    "heatmap": ["ADEP", "City", "ADEP Latitude", "ADEP Longitude", "prcp", "tavg", "snow"],
+    "timewindow": ["ECTRL ID", "ADEP", "ADES", "AC Registration", "AC Operator",
+                   "AC Type", "ADEP Latitude", "ADEP Longitude",
+                   "ADES Latitude", "ADES Longitude"] + TIME_COLS
+                  + ["DEPTDEL", "ARVLDEL", "PREV LEG"],
+}
+
+
+def parse_raw(df: pd.DataFrame) -> pd.DataFrame:
+    """Parse the raw string timestamps and compute delays in minutes."""
+    df = df.copy()
+    for col in TIME_COLS:
+        if not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(
+                df[col], format=DATE_FORMAT, errors='coerce')
+    df['DEPTDEL'] = (df["ACTUAL OFF BLOCK TIME"] -
+                     df["FILED OFF BLOCK TIME"]).dt.total_seconds() / 60
+    df['ARVLDEL'] = (df["ACTUAL ARRIVAL TIME"] -
+                     df["FILED ARRIVAL TIME"]).dt.total_seconds() / 60
+    return df
+
+
+def _calendar_part(values: pd.Series) -> np.ndarray:
+    return values.fillna(-1).to_numpy(dtype=np.int8)
+
+
+def hour_order(hour: np.ndarray) -> np.ndarray:
+    """Hours on the 04-03 operational day axis (00-03 become 24-27)."""
+    return np.where((hour >= 0) & (hour < 4), hour + 24, hour).astype(np.int8)
+
+
+def bracket_dtype(edges) -> pd.CategoricalDtype:
+    """Ordered bracket labels for ascending ``edges``, e.g. 0-15/15-30/30-90/90+."""
+    bounds = [0] + list(edges)
+    labels = [f"{lo}-{hi}" for lo, hi in zip(bounds, bounds[1:])] + [f"{bounds[-1]}+"]
+    return pd.CategoricalDtype(labels, ordered=True)
+
+
+def bin_delays(delays: np.ndarray, edges) -> np.ndarray:
+    """Index of the bracket each delay falls in, for ascending ``edges``.
+
+    Missing delays sort past every edge and land in the last bracket, as before.
+    """
+    return np.searchsorted(edges, delays, side='right')
+
+
+def delay_bracket(delays: pd.Series, edges=DELAY_BRACKET_EDGES) -> pd.Categorical:
+    return pd.Categorical.from_codes(bin_delays(delays.to_numpy(), edges),
+                                     dtype=bracket_dtype(edges))
+
+
+def rebin_delays(bins: np.ndarray, edges) -> pd.Categorical:
+    """Brackets for ``edges`` from delays already binned on BRACKET_EDGE_CHOICES.
+
+    ``edges`` must be a subset of the choices. Each bin maps to one bracket
+    through a small lookup table, so rebinning is a single gather.
+    """
+    edges = sorted(edges)
+    if not set(edges) <= set(BRACKET_EDGE_CHOICES):
+        raise ValueError(f"Bracket edges must be taken from {BRACKET_EDGE_CHOICES}")
+    lower_bounds = [-np.inf] + BRACKET_EDGE_CHOICES
+    table = bin_delays(np.array(lower_bounds), edges)
+    return pd.Categorical.from_codes(table[bins], dtype=bracket_dtype(edges))
+
+
+def add_derived(df: pd.DataFrame) -> pd.DataFrame:
+    """Add the calendar and bracket columns the pages group on."""
+    df = df.copy()
+    for prefix, col in (("DEP", "FILED OFF BLOCK TIME"), ("ARR", "FILED ARRIVAL TIME")):
+        times = df[col].dt
+        hour = _calendar_part(times.hour)
+        df[f"{prefix} HOUR"] = hour
+        df[f"{prefix} DAY"] = _calendar_part(times.day)
+        df[f"{prefix} MONTH"] = _calendar_part(times.month)
+        df[f"{prefix} HOUR ORDER"] = hour_order(hour)
+    df["Delay Bracket"] = delay_bracket(df["DEPTDEL"])
+    return df
+
+
+def build_dictionaries(df: pd.DataFrame, previous=None) -> dict[str, list[str]]:
+    """Category lists per dimension for the columns present in ``df``.
+
+    Values already in ``previous`` keep their position and new values are
+    appended in sorted order, so codes stay stable across ingests.
+    """
+    dictionaries = {name: list(values) for name, values in (previous or {}).items()}
+    for name in dict.fromkeys(DIMENSIONS.values()):
+        cols = [col for col, dim in DIMENSIONS.items() if dim == name and col in df.columns]
+        if not cols:
+            continue
+        known = dictionaries.setdefault(name, [])
+        seen = set(known)
+        values = set()
+        for col in cols:
+            values.update(df[col].dropna().astype(str).unique())
+        known.extend(sorted(values - seen))
+    return dictionaries
+
+
+def dimension_dtypes(dictionaries: dict[str, list[str]]) -> dict[str, pd.CategoricalDtype]:
+    return {col: pd.CategoricalDtype(dictionaries[name])
+            for col, name in DIMENSIONS.items() if name in dictionaries}
+
+
+def encode_dimensions(df: pd.DataFrame, dictionaries: dict[str, list[str]]) -> pd.DataFrame:
+    """Cast the dimension columns in ``df`` to their shared categorical dtypes."""
+    dtypes = {col: dtype for col, dtype in dimension_dtypes(dictionaries).items()
+              if col in df.columns}
+    return df.astype(dtypes) if dtypes else df
@@ -0,0 +1,149 @@
+"""Mergeable quantile sketches of departure and arrival delays.
+
+Each delay is counted in a logarithmic bucket, as in DDSketch: bucket k > 0
+holds delays in (MIN_DELAY * g**(k-2), MIN_DELAY * g**(k-1)] for the growth
+factor g, negative buckets mirror that for early departures and arrivals, and
+bucket 0 holds delays of exactly zero. Every bucket's representative value is
+within SKETCH_ACCURACY (relative) of all delays in it, so a quantile read from
+the bucket counts is too, however many flights there are, and a sketch never
+holds more than a fixed number of buckets.
+
+Ingest keeps one sketch per (ADEP, date, hour) for each measure: departure
+delays on their filed off-block date and hour, arrival delays on their filed
+arrival date and hour. Sketches merge by adding bucket counts, so rows of
+different batches simply add up and any range of cells merges at query time.
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# Relative error of every quantile read from a sketch
+SKETCH_ACCURACY = 0.01
+# Smallest non-zero delay in minutes; raw timestamps have whole seconds
+MIN_DELAY = 1 / 60
+_GROWTH = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+
+SKETCH_KEYS = ["ADEP", "DATE", "HOUR", "BUCKET"]
+# Delay column -> column prefix of its bucket counts, and the filed time it is dated by
+SKETCH_MEASURES = {
+    "DEPTDEL": ("dep", "FILED OFF BLOCK TIME"),
+    "ARVLDEL": ("arr", "FILED ARRIVAL TIME"),
+}
+# Flight columns the sketches are built from
+SKETCH_COLUMNS = ["ADEP", "DEPTDEL", "FILED OFF BLOCK TIME", "ARVLDEL", "FILED ARRIVAL TIME"]
+
+# Quantiles the pages offer, by label
+QUANTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+
+
+def sketch_buckets(delays: np.ndarray) -> np.ndarray:
+    """Bucket of each (non-missing) delay in minutes."""
+    magnitude = np.abs(delays)
+    # Delays within half a second of zero are zero; the rest are at least MIN_DELAY
+    index = np.ceil(np.log(np.maximum(magnitude, MIN_DELAY) / MIN_DELAY) / np.log(_GROWTH))
+    return np.where(magnitude < MIN_DELAY / 2, 0, np.sign(delays) * (index + 1)).astype(np.int16)
+
+
+def bucket_values(buckets: np.ndarray) -> np.ndarray:
+    """Representative delay of each bucket, within SKETCH_ACCURACY of its delays."""
+    magnitude = MIN_DELAY * 2 * _GROWTH ** (np.abs(buckets) - 1.0) / (_GROWTH + 1)
+    return np.where(buckets == 0, 0.0, np.sign(buckets) * magnitude)
+
+
+def build_sketches(df: pd.DataFrame) -> pd.DataFrame:
+    """Count flights into one row per (ADEP, DATE, HOUR, BUCKET) with a delay.
+
+    ``<prefix>_count`` counts each measure's delays; flights without the delay
+    or its filed time are left out, missing airports are kept as their own key.
+    """
+    parts = []
+    for col, (prefix, time_col) in SKETCH_MEASURES.items():
+        rows = df[df[col].notna() & df[time_col].notna()]
+        times = rows[time_col].dt
+        keys = [rows["ADEP"], times.normalize().rename("DATE"),
+                times.hour.astype(np.int8).rename("HOUR"),
+                pd.Series(sketch_buckets(rows[col].to_numpy(dtype=float)),
+                          index=rows.index, name="BUCKET")]
+        parts.append(rows.groupby(keys, observed=True, dropna=False).size()
+                     .rename(f"{prefix}_count"))
+    return (pd.concat(parts, axis=1).fillna(0).astype(np.int64).reset_index()
+            .sort_values("DATE", kind="stable").reset_index(drop=True))
+
+
+def merge_quantiles(groups: np.ndarray, n_groups: int, buckets: np.ndarray,
+                    counts: np.ndarray, quantiles) -> np.ndarray:
+    """Merge sketch rows per group and read ``quantiles`` from each merged sketch.
+
+    Returns an (n_groups, len(quantiles)) array; groups without a delay are NaN.
+    """
+    quantiles = np.asarray(quantiles, dtype=float)
+    if not len(buckets):
+        return np.full((n_groups, len(quantiles)), np.nan)
+    lowest = int(buckets.min())
+    width = int(buckets.max()) - lowest + 1
+    merged = np.bincount(groups * width + buckets - lowest, weights=counts,
+                         minlength=n_groups * width).reshape(n_groups, width)
+    cumulative = merged.cumsum(axis=1)
+    ranks = quantiles * (cumulative[:, -1:] - 1)
+    # First bucket whose cumulative count passes each rank
+    found = (cumulative[:, None, :] > ranks[:, :, None]).argmax(axis=2)
+    values = bucket_values(found + lowest)
+    return np.where(cumulative[:, -1:] > 0, values, np.nan)
+
+
+class DelaySketches:
+    """Sketch rows of build_sketches(), of one or several batches, sorted by date."""
+
+    def __init__(self, rows: pd.DataFrame):
+        rows = rows.sort_values("DATE", kind="stable")
+        self._dates = rows["DATE"].to_numpy(dtype="datetime64[D]")
+        months = self._dates.astype("datetime64[M]")
+        self._months = months.astype(np.int64) % 12 + 1
+        self._month_days = (self._dates - months).astype(np.int64) + 1
+        self._airports = rows["ADEP"].cat.codes.to_numpy()
+        self._categories = rows["ADEP"].cat.categories
+        self._hours = rows["HOUR"].to_numpy(dtype=np.int64)
+        self._buckets = rows["BUCKET"].to_numpy(dtype=np.int64)
+        self._counts = {measure: rows[f"{prefix}_count"].to_numpy()
+                        for measure, (prefix, _) in SKETCH_MEASURES.items()}
+
+    def _span(self, first: date, last: date) -> slice:
+        lo = np.searchsorted(self._dates, np.datetime64(first, "D"), side="left")
+        hi = np.searchsorted(self._dates, np.datetime64(last, "D"), side="right")
+        return slice(lo, max(lo, hi))
+
+    def _codes(self, airports) -> list[int]:
+        return [self._categories.get_loc(a) for a in airports if a in self._categories]
+
+    def quantiles(self, measure: str, first: date, last: date, quantiles,
+                  airports=None) -> np.ndarray:
+        """``quantiles`` of ``measure`` over ``first``..``last``, only ``airports`` if given."""
+        span = self._span(first, last)
+        counts = self._counts[measure][span]
+        keep = counts > 0
+        if airports:
+            keep &= np.isin(self._airports[span], self._codes(airports))
+        return merge_quantiles(np.zeros(keep.sum(), dtype=np.int64), 1,
+                               self._buckets[span][keep], counts[keep], quantiles)[0]
+
+    def _positive(self, measure: str, rows, airport: str) -> np.ndarray:
+        # Rows of ``airport`` among ``rows`` counting positive delays of ``measure``
+        keep = (self._counts[measure][rows] > 0) & (self._buckets[rows] > 0)
+        return keep & np.isin(self._airports[rows], self._codes([airport]))
+
+    def hourly(self, measure: str, airport: str, day: date, quantile: float) -> np.ndarray:
+        """``quantile`` of the positive ``measure`` delays at ``airport`` on ``day`` per 04-03 hour."""
+        span = self._span(day, day)
+        keep = self._positive(measure, span, airport)
+        # Hours 04..23 come first, 00..03 last, as on the HOUR_ORDERS axis
+        groups = (self._hours[span][keep] - 4) % 24
+        return merge_quantiles(groups, 24, self._buckets[span][keep],
+                               self._counts[measure][span][keep], [quantile])[:, 0]
+
+    def daily(self, measure: str, airport: str, month: int, quantile: float) -> np.ndarray:
+        """``quantile`` of the positive ``measure`` delays at ``airport`` on days 1..31 of ``month``."""
+        rows = np.flatnonzero(self._months == month)
+        keep = self._positive(measure, rows, airport)
+        return merge_quantiles(self._month_days[rows][keep] - 1, 31, self._buckets[rows][keep],
+                               self._counts[measure][rows][keep], [quantile])[:, 0]
@@ -0,0 +1,1008 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Callable, NamedTuple
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import streamlit as st
+
+from .cube import CUBE_COLUMNS, CUBE_KEYS, build_cube, cube_days, sort_cube
+from .delays import DelayIndex, DelaySummary, delay_table, summarize_delays
+from .engines import open_engine
+from .hourly import HourlyDelays
+from .ingest import (OPTIMIZED_DIR, cache_files, dataset_path, load_dictionaries, raw_files,
+                     raw_schema, read_raw_files)
+from .ipc import ipc_columns, open_ipc
+from .manifest import diff_files, file_entry, load_manifest, manifest_path
+from .monthly import MONTHLY_COLUMNS, MONTHLY_KEYS, MonthlyDelays, build_daily_delays
+from .partitions import PARTITIONING, day_filter, days_between, partition_dir
+from .propagation import MIN_TURNAROUND, PROPAGATION_COLUMNS, DelayPropagation
+from .registrations import RegistrationIndex
+from .rotations import ROTATION_COLS, ROTATION_INPUTS, link_rotations
+from .schema import (CATEGORICAL_DTYPES, DIMENSIONS, PAGE_COLUMNS, build_dictionaries,
+                     dimension_dtypes)
+from .sketches import (QUANTILES, SKETCH_COLUMNS, SKETCH_KEYS, DelaySketches,
+                       build_sketches)
+
+# Pages derive their own filtered frames from the shared table; copy-on-write
+# guarantees none of those derived frames can write back into it.
+pd.set_option("mode.copy_on_write", True)
+
+log = logging.getLogger(__name__)
+
+# How many derived results (day windows, option lists, aggregates) the store keeps,
+# and how much memory they may hold together; the least recently used go first.
+# Whole-history indexes (see `FlightStore.index`) are kept apart, under their own
+# memory budget.
+DERIVED_CACHE_SIZE = 64
+DERIVED_CACHE_BYTES = 512 * 2**20
+DERIVED_INDEX_BYTES = 1024 * 2**20
+# Minimum seconds between checks for newly ingested data
+REFRESH_INTERVAL = 30
+# Engine for the flight-level aggregations (see engines.py): "pandas", "duckdb"
+# or "polars"
+QUERY_ENGINE = os.environ.get("FLIGHTDATA_ENGINE", "pandas")
+
+
+# --------------------------------------------------------------------------------
+# Sources
+# --------------------------------------------------------------------------------
+
+
+class Update(NamedTuple):
+    """New data found by a source poll. ``read`` is None when a full reload is needed.
+
+    ``read(columns)`` returns the new rows, or every row when ``whole`` is set.
+    """
+
+    read: Callable | None
+    first_day: date | None = None
+    last_day: date | None = None
+    whole: bool = False
+
+
+RELOAD = Update(None)
+
+
+def _normalize(df: pd.DataFrame, dtypes) -> pd.DataFrame:
+    # Each partition file carries its own dictionary; map every categorical
+    # column onto its shared categories so codes agree across reads
+    dtypes = {col: dtype for col, dtype in dtypes.items() if col in df.columns}
+    # astype() keeps the codes of a categorical whose categories only differ in
+    # order (unordered dtypes compare equal), so recode those explicitly
+    columns = {col: df[col].cat.set_categories(dtype.categories, ordered=dtype.ordered)
+               if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col].astype(dtype)
+               for col, dtype in dtypes.items()}
+    return df.assign(**columns) if columns else df
+
+
+class DatasetSource:
+    """The hive-partitioned dataset written by `ingest`, as listed in its manifest.
+
+    Its timestamps and derived columns are stored natively, so loading is pure
+    I/O. Whole columns come from the memory-mapped IPC copy of the table as
+    zero-copy views shared by every process on the host; day-range reads only
+    touch the matching parquet partitions. Batches are read in manifest
+    order, so appended batches always land at the end. Builds that kept one
+    IPC copy per batch still load, but their columns are copied together.
+
+    Builds written before the rotation chains are linked once when the
+    rotation columns are first read. Their day windows are then cut from the
+    loaded columns rather than the partitions, so the links line up with
+    every row.
+    """
+
+    def __init__(self, manifest: dict, dest=OPTIMIZED_DIR):
+        self._dest = dest
+        self._stamp = os.stat(manifest_path(dest)).st_mtime
+        self._manifest = manifest
+        self._dataset = self._open(manifest["batches"])
+        self._dtypes = self._load_dtypes()
+        self._mapped = {}
+        self._links = None
+        # Day windows from the partitions (and the engines reading them) need
+        # the rotation columns stored
+        self.partitioned = set(ROTATION_COLS) <= set(self._stored_columns())
+        if not self.partitioned:
+            log.warning("The optimized dataset predates rotation chains; linking them at "
+                        "load time until `python -m flight_app.flightdata` rebuilds it")
+
+    def _load_dtypes(self):
+        return {**CATEGORICAL_DTYPES, **dimension_dtypes(load_dictionaries(self._dest))}
+
+    def _open(self, batches):
+        base = dataset_path(self._manifest, self._dest)
+        files = [os.path.join(base, fragment)
+                 for batch in batches for fragment in batch["fragments"]]
+        return ds.dataset(files, format="parquet", partitioning=PARTITIONING,
+                          partition_base_dir=base)
+
+    def files(self, days=None) -> list[str]:
+        """Paths of the parquet partitions, in read order; only ``days`` (first, last) if given."""
+        fragments = [fragment for batch in self._manifest["batches"]
+                     for fragment in batch["fragments"]]
+        if days is not None:
+            wanted = {partition_dir(day) for day in days_between(*days)}
+            fragments = [fragment for fragment in fragments
+                         if os.path.dirname(fragment) in wanted]
+        base = dataset_path(self._manifest, self._dest)
+        return [os.path.join(base, fragment) for fragment in fragments]
+
+    def normalize(self, df: pd.DataFrame) -> pd.DataFrame:
+        """``df`` with its dimension columns mapped onto the shared categories."""
+        return _normalize(df, self._dtypes)
+
+    def _mapped_tables(self) -> list | None:
+        # None when the build predates the IPC copies; the parquet files are read instead
+        names = cache_files(self._manifest)
+        if names is None:
+            return None
+        base = dataset_path(self._manifest, self._dest)
+        # Copies replaced by an append are unmapped once no column views them
+        self._mapped = {name: self._mapped[name] if name in self._mapped
+                        else open_ipc(os.path.join(base, name)) for name in names}
+        return list(self._mapped.values())
+
+    def _stored_columns(self) -> list[str]:
+        # Whole columns must all come from the same files to line up row for row
+        tables = self._mapped_tables()
+        return tables[0].schema.names if tables else self._dataset.schema.names
+
+    @property
+    def columns(self) -> list[str]:
+        stored = self._stored_columns()
+        return stored if self.partitioned else stored + ROTATION_COLS
+
+    def _rotations(self, columns) -> dict[str, np.ndarray]:
+        # The requested rotation columns, linked over the whole build on first use
+        links = [col for col in columns if col in ROTATION_COLS]
+        if links and self._links is None:
+            self._links = link_rotations(self._read_all(ROTATION_INPUTS))
+        return {col: self._links[col].to_numpy() for col in links}
+
+    def _read(self, dataset, columns, filter=None) -> pd.DataFrame:
+        table = dataset.to_table(columns=list(columns), filter=filter)
+        return _normalize(table.to_pandas(), self._dtypes)
+
+    def _read_all(self, columns) -> pd.DataFrame:
+        tables = self._mapped_tables()
+        if tables is None:
+            return self._read(self._dataset, columns)
+        frames = [ipc_columns(table, columns, self._dtypes) for table in tables]
+        return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+    def read(self, columns, filter=None) -> pd.DataFrame:
+        if filter is not None:
+            return self._read(self._dataset, columns, filter)
+        if self.partitioned:
+            return self._read_all(columns)
+        links = self._rotations(columns)
+        # At least one stored column, so the frame has its rows
+        df = self._read_all([col for col in columns if col not in links] or ["ADEP"])
+        return df.assign(**links)[list(columns)]
+
+    def take(self, rows: np.ndarray, columns) -> pd.DataFrame | None:
+        """The flights at table positions ``rows``, in that order and indexed by them.
+
+        Only those rows are copied out of the mapped copy. None for builds
+        without IPC copies.
+        """
+        tables = self._mapped_tables()
+        if tables is None:
+            return None
+        links = self._rotations(columns)
+        stored = [col for col in columns if col not in links]
+        offsets = np.cumsum([0] + [table.num_rows for table in tables])
+        batch = np.searchsorted(offsets, rows, side="right") - 1
+        frames, picked = [], []
+        for i, table in enumerate(tables):
+            mine = np.flatnonzero(batch == i)
+            frames.append(ipc_columns(table.select(stored).take(rows[mine] - offsets[i]),
+                                      stored, self._dtypes))
+            picked.append(mine)
+        df = pd.concat(frames, ignore_index=True)
+        df = df.take(np.argsort(np.concatenate(picked), kind="stable"))
+        df = df.set_axis(pd.Index(rows), axis=0)
+        return df.assign(**{col: values[rows] for col, values in links.items()})[list(columns)]
+
+    def _aggregates(self, kind) -> pd.DataFrame | None:
+        batches = self._manifest["batches"]
+        if not all(batch.get(kind) for batch in batches):
+            return None
+        base = dataset_path(self._manifest, self._dest)
+        return pd.concat([_normalize(pq.read_table(os.path.join(base, batch[kind])).to_pandas(),
+                                     self._dtypes) for batch in batches], ignore_index=True)
+
+    def cube(self) -> pd.DataFrame | None:
+        """The Overview cubes written by ingest, or None for builds without them."""
+        return self._aggregates("cube")
+
+    def daily_delays(self) -> pd.DataFrame | None:
+        """The Monthly comparison aggregates written by ingest, or None for builds without them."""
+        return self._aggregates("daily")
+
+    def sketches(self) -> pd.DataFrame | None:
+        """The delay quantile sketches written by ingest, or None for builds without them."""
+        return self._aggregates("sketch")
+
+    def poll(self) -> Update | None:
+        """Pick up batches appended by `ingest --incremental` since the last poll."""
+        path = manifest_path(self._dest)
+        stamp = os.stat(path).st_mtime if os.path.exists(path) else None
+        if stamp == self._stamp:
+            return None
+        manifest = load_manifest(self._dest)
+        if manifest is None or manifest["build"] != self._manifest["build"]:
+            return RELOAD
+        self._stamp = stamp
+        known = {batch["id"] for batch in self._manifest["batches"]}
+        added = [batch for batch in manifest["batches"] if batch["id"] not in known]
+        if not added:
+            return None
+        if not self.partitioned:
+            return RELOAD  # the chains are linked over the whole build
+        self._manifest = manifest
+        self._dataset = self._open(manifest["batches"])
+        self._dtypes = self._load_dtypes()
+        days = [date.fromisoformat(batch[key]) for batch in added
+                for key in ("first_day", "last_day") if batch[key]]
+        # The append rewrote the IPC copy; whole columns are mapped from it again
+        return Update(self._read_all, min(days, default=None), max(days, default=None),
+                      whole=True)
+
+
+class RawSource:
+    """Fallback when `ingest` has not been run: parse the raw exports.
+
+    The file list is fixed when the source is created so every column read
+    covers the same rows; poll() appends files that appeared since.
+    """
+
+    partitioned = False
+
+    def __init__(self):
+        self._paths = raw_files()
+        self._files = {os.path.basename(path): file_entry(path, with_hash=False)
+                       for path in self._paths}
+        columns = raw_schema()
+        self._columns = columns + ROTATION_COLS if columns else []
+        self._dictionaries = None
+
+    @property
+    def columns(self) -> list[str]:
+        return self._columns
+
+    def _dimension_dtypes(self):
+        # Built from the dimension columns on first use, as ingest would
+        if self._dictionaries is None:
+            dims = [col for col in DIMENSIONS if col in self.columns]
+            self._dictionaries = build_dictionaries(read_raw_files(self._paths, dims))
+        return dimension_dtypes(self._dictionaries)
+
+    def _read(self, paths, columns) -> pd.DataFrame:
+        links = [col for col in columns if col in ROTATION_COLS]
+        # At least one raw column, so the frame has its rows
+        df = read_raw_files(paths, [col for col in columns if col not in ROTATION_COLS]
+                            or ["AC Registration"])
+        if any(col in DIMENSIONS for col in columns):
+            df = _normalize(df, self._dimension_dtypes())
+        if links:
+            # Chains run across files, so they are linked over all of them;
+            # ``paths`` are always the last of those
+            linked = link_rotations(read_raw_files(self._paths, ROTATION_INPUTS))
+            df = df.assign(**{col: linked[col].to_numpy()[len(linked) - len(df):]
+                              for col in links})
+        return df[list(columns)]
+
+    def read(self, columns, filter=None) -> pd.DataFrame:
+        return self._read(self._paths, columns)
+
+    def take(self, rows, columns) -> None:
+        return None  # the raw files are parsed whole; gathered from the loaded columns
+
+    def cube(self) -> None:
+        return None  # built from the loaded columns instead
+
+    def daily_delays(self) -> None:
+        return None
+
+    def sketches(self) -> None:
+        return None
+
+    def poll(self) -> Update | None:
+        if load_manifest(OPTIMIZED_DIR) is not None:
+            return RELOAD  # `ingest` has run since; switch to the dataset
+        paths = raw_files()
+        new, changed = diff_files(self._files, paths, with_hash=False)
+        if changed:
+            return RELOAD
+        if not new:
+            return None
+        added = [path for path in paths if os.path.basename(path) in new]
+        self._paths = self._paths + added
+        self._files.update({os.path.basename(path): file_entry(path, with_hash=False)
+                            for path in added})
+        if self._dictionaries is not None:
+            dims = [col for col in DIMENSIONS if col in self.columns]
+            self._dictionaries = build_dictionaries(
+                read_raw_files(added, dims), self._dictionaries)
+        filed = read_raw_files(added, ["FILED OFF BLOCK TIME"])["FILED OFF BLOCK TIME"].dropna()
+        return Update(lambda columns: self._read(added, columns),
+                      filed.min().date() if len(filed) else None,
+                      filed.max().date() if len(filed) else None)
+
+
+def _source():
+    manifest = load_manifest(OPTIMIZED_DIR)
+    if manifest is not None and os.path.isdir(dataset_path(manifest)):
+        return DatasetSource(manifest)
+    return RawSource()
+
+
+def _nbytes(value) -> int:
+    """Approximate memory held by a derived result (0 for values of unknown size)."""
+    # deep=True counts the strings behind object columns, not just their pointers
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, pd.Index):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(_nbytes(item) for item in value.values())
+    if type(value).__module__.startswith(__package__):
+        return sum(_nbytes(item) for item in vars(value).values())
+    return 0
+
+
+def _time_order(values: pd.Series):
+    """Stable sort order of a timestamp column and its sorted int64 (ns) keys.
+
+    NaT sorts first as the smallest int64, so no time window ever matches it.
+    """
+    keys = values.to_numpy(dtype="datetime64[ns]").view("i8")
+    order = np.argsort(keys, kind="stable")
+    return order, keys[order]
+
+
+# --------------------------------------------------------------------------------
+# Shared store
+# --------------------------------------------------------------------------------
+
+
+class FlightStore:
+    """Read-only flight table loaded once per process and shared by all sessions.
+
+    Columns are read from parquet the first time any page asks for them and
+    then kept, so each column is held in memory once no matter how many pages
+    project it. Newly ingested batches are appended to the loaded columns, and
+    only the derived results whose days they touch are dropped.
+    """
+
+    def __init__(self, source):
+        self._lock = threading.RLock()
+        self._generation = 0
+        self._hits = self._misses = 0
+        self._reset(source)
+
+    def _reset(self, source):
+        self._source = source
+        self._available = list(source.columns)
+        self._columns: dict[str, pd.Series] = {}
+        self._derived: OrderedDict = OrderedDict()
+        self._derived_bytes = 0
+        self._indexes: OrderedDict = OrderedDict()
+        self._index_bytes = 0
+        self._polled = time.monotonic()
+        self._engine = open_engine(QUERY_ENGINE, self, source)
+
+    @property
+    def columns(self) -> list[str]:
+        return self._available
+
+    @property
+    def empty(self) -> bool:
+        return not self._available
+
+    @property
+    def engine(self):
+        """The query engine the flight-level aggregations run on."""
+        return self._engine
+
+    @property
+    def generation(self) -> int:
+        """Bumped whenever new data is appended or the store reloads."""
+        return self._generation
+
+    def _ensure(self, columns) -> dict[str, pd.Series]:
+        # Returns one consistent snapshot of the column map
+        with self._lock:
+            missing = [col for col in columns if col not in self._columns]
+            if missing:
+                loaded = self._source.read(missing)
+                self._columns = {**self._columns,
+                                 **{col: loaded[col] for col in missing}}
+            return self._columns
+
+    def frame(self, columns=None) -> pd.DataFrame:
+        """A frame over the shared column data; no column values are copied."""
+        if self.empty:
+            return pd.DataFrame()
+        columns = self._available if columns is None else list(columns)
+        loaded = self._ensure(columns)
+        return pd.DataFrame({col: loaded[col] for col in columns}, copy=False)
+
+    def take(self, rows, columns=None) -> pd.DataFrame:
+        """The flights at table positions ``rows``, in that order and indexed by them.
+
+        Unless the columns are loaded already, the rows are gathered straight
+        from the source, so looking up a few flights loads no whole columns.
+        """
+        if self.empty:
+            return pd.DataFrame()
+        columns = self._available if columns is None else list(columns)
+        rows = np.asarray(rows, dtype=np.int64)
+        with self._lock:
+            if any(col not in self._columns for col in columns):
+                taken = self._source.take(rows, columns)
+                if taken is not None:
+                    return taken
+        return self.frame(columns).take(rows)
+
+    # ---- derived results -------------------------------------------------------
+
+    def cached(self, key, build, days=None):
+        """Memoize ``build()`` under ``key`` until new data invalidates it.
+
+        ``days`` is the (first, last) filed-date range the result depends on;
+        None means it depends on the whole history. Results are shared by all
+        sessions and evicted least recently used first, past DERIVED_CACHE_SIZE
+        entries or DERIVED_CACHE_BYTES of memory.
+        """
+        with self._lock:
+            if key in self._derived:
+                self._hits += 1
+                self._derived.move_to_end(key)
+                return self._derived[key][1]
+            self._misses += 1
+            generation = self._generation
+        value = build()
+        nbytes = _nbytes(value)
+        with self._lock:
+            # Drop results computed while a refresh was swapping data in
+            if generation == self._generation:
+                if key in self._derived:
+                    self._derived_bytes -= self._derived.pop(key)[2]
+                self._derived[key] = (days, value, nbytes)
+                self._derived_bytes += nbytes
+                while len(self._derived) > 1 and (len(self._derived) > DERIVED_CACHE_SIZE
+                                                  or self._derived_bytes > DERIVED_CACHE_BYTES):
+                    self._derived_bytes -= self._derived.popitem(last=False)[1][2]
+        return value
+
+    def index(self, key, build):
+        """Memoize the whole-history index ``build()`` under ``key`` until new data arrives.
+
+        Indexes are built from the full table and answer many queries, so they
+        are kept outside the `cached` LRU: evicting one to make room for query
+        results would only rebuild it on the next query. Past DERIVED_INDEX_BYTES
+        of memory the least recently used indexes are dropped instead.
+        """
+        with self._lock:
+            if key in self._indexes:
+                self._hits += 1
+                self._indexes.move_to_end(key)
+                return self._indexes[key][0]
+            self._misses += 1
+            generation = self._generation
+        value = build()
+        nbytes = _nbytes(value)
+        with self._lock:
+            if generation == self._generation:
+                if key in self._indexes:
+                    self._index_bytes -= self._indexes.pop(key)[1]
+                self._indexes[key] = (value, nbytes)
+                self._index_bytes += nbytes
+                while len(self._indexes) > 1 and self._index_bytes > DERIVED_INDEX_BYTES:
+                    evicted, (_, size) = self._indexes.popitem(last=False)
+                    self._index_bytes -= size
+                    log.warning("Dropped the %r index (%d MiB) to stay within "
+                                "DERIVED_INDEX_BYTES", evicted, size // 2**20)
+        return value
+
+    def cache_info(self) -> dict[str, int]:
+        """Hits and misses of `cached` and `index` since the store opened, and what they hold now."""
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses,
+                    "entries": len(self._derived), "bytes": self._derived_bytes,
+                    "indexes": len(self._indexes),
+                    "index_bytes": self._index_bytes}
+
+    def _invalidate(self, first: date | None, last: date | None):
+        # Every index covers the whole history
+        self._indexes = OrderedDict()
+        self._index_bytes = 0
+        for key, (days, _, nbytes) in list(self._derived.items()):
+            if days is None or first is None or (days[0] <= last and first <= days[1]):
+                del self._derived[key]
+                self._derived_bytes -= nbytes
+
+    # ---- refresh ---------------------------------------------------------------
+
+    def refresh(self):
+        """Append newly ingested data (or reload if the dataset was rebuilt)."""
+        with self._lock:
+            self._polled = time.monotonic()
+            update = self._source.poll()
+            if update is None:
+                return
+            if update.read is None:
+                self._reset(_source())
+                self._generation += 1
+                return
+            appended = {}
+            if self._columns and update.whole:
+                loaded = update.read(list(self._columns))
+                appended = {col: loaded[col] for col in self._columns}
+            elif self._columns:
+                delta = update.read(list(self._columns))
+                for col, current in self._columns.items():
+                    added = delta[col]
+                    if isinstance(added.dtype, pd.CategoricalDtype) and added.dtype != current.dtype:
+                        # Dictionaries only grow; recode onto the extended categories
+                        current = current.astype(added.dtype)
+                    appended[col] = pd.concat([current, added], ignore_index=True)
+            self._columns = appended
+            self._invalidate(update.first_day, update.last_day)
+            self._generation += 1
+
+    def maybe_refresh(self):
+        if time.monotonic() - self._polled >= REFRESH_INTERVAL:
+            self.refresh()
+
+    # ---- day windows -----------------------------------------------------------
+
+    def days(self, first: date, last: date, columns) -> pd.DataFrame:
+        """Flights filed to leave between ``first`` and ``last`` (inclusive).
+
+        On the partitioned dataset only those days' files are read; results are
+        cached with the other derived results, shared by all sessions.
+        """
+        columns = list(columns)
+        if self.empty:
+            return pd.DataFrame()
+
+        def build():
+            if self._source.partitioned:
+                return self._source.read(columns, filter=day_filter(first, last))
+            return self.slice_by_time("FILED OFF BLOCK TIME", pd.Timestamp(first),
+                                      pd.Timestamp(last) + pd.Timedelta(days=1),
+                                      columns).reset_index(drop=True)
+
+        return self.cached(("days", first, last, tuple(columns)), build, days=(first, last))
+
+    # ---- Overview cube ---------------------------------------------------------
+
+    def cube(self) -> pd.DataFrame:
+        """The Overview cube (see cube.py), sorted by filed date."""
+        def build():
+            cube = self._source.cube()
+            # Cubes written before their current key layout are rebuilt here
+            if cube is None or not set(CUBE_KEYS) <= set(cube.columns):
+                cube = build_cube(self.frame(CUBE_COLUMNS))
+            return sort_cube(cube)
+
+        return self.index("cube", build)
+
+    def daily_delays(self) -> pd.DataFrame:
+        """Per-airport daily aggregates of positive delays (see monthly.py)."""
+        rows = self._source.daily_delays()
+        if rows is None or not set(MONTHLY_KEYS) <= set(rows.columns):
+            rows = build_daily_delays(self.frame(MONTHLY_COLUMNS))
+        return rows
+
+    def sketches(self) -> pd.DataFrame:
+        """Delay quantile sketches per airport, date and hour (see sketches.py)."""
+        rows = self._source.sketches()
+        if rows is None or not set(SKETCH_KEYS) <= set(rows.columns):
+            rows = build_sketches(self.frame(SKETCH_COLUMNS))
+        return rows
+
+    # ---- time slicing ----------------------------------------------------------
+
+    def slice_by_time(self, col, start, end, columns=None, days=None,
+                      closed="left") -> pd.DataFrame:
+        """Rows whose ``col`` lies between ``start`` and ``end``, found by binary search.
+
+        ``closed`` is "left" for ``start <= col < end`` or "both" for
+        ``start <= col <= end``. With ``days``, the rows come from that
+        ``days(first, last, columns)`` window instead of the whole table. Rows
+        keep their original order and index, as a boolean mask would.
+        """
+        if self.empty:
+            return pd.DataFrame()
+        columns = self._available if columns is None else list(columns)
+        if days is None:
+            frame = self.frame(columns)
+            times = self.frame([col])[col]
+        else:
+            loaded = self.days(*days, columns if col in columns else columns + [col])
+            frame, times = loaded[columns], loaded[col]
+        if frame.empty:
+            return frame
+        if days is None:
+            order, keys = self.index(("order", col), lambda: _time_order(times))
+        else:
+            order, keys = self.cached(("order", col, days, tuple(columns)),
+                                      lambda: _time_order(times), days=days)
+        if len(order) != len(frame):
+            order, keys = _time_order(times)  # a refresh landed in between
+        lo = np.searchsorted(keys, pd.Timestamp(start).value, side="left")
+        hi = np.searchsorted(keys, pd.Timestamp(end).value,
+                             side="right" if closed == "both" else "left")
+        return frame.take(np.sort(order[lo:hi]))
+
+    # ---- aircraft lookups ------------------------------------------------------
+
+    def _registration_index(self, col) -> RegistrationIndex:
+        def build():
+            loaded = self.frame(["AC Registration", col])
+            return RegistrationIndex(loaded["AC Registration"], loaded[col])
+
+        return self.index(("registrations", col), build)
+
+    def aircraft_legs(self, registrations, col, start, end, columns=None,
+                      closed="left") -> pd.DataFrame:
+        """Flights of the ``registrations`` whose ``col`` lies between ``start`` and ``end``.
+
+        Each aircraft is one dictionary lookup and two binary searches in the
+        RegistrationIndex over ``col``, and only the matching rows of
+        ``columns`` are read (see `take`). ``closed`` is as in `slice_by_time`;
+        rows keep their original order and index.
+        """
+        if self.empty:
+            return pd.DataFrame()
+        index = self._registration_index(col)
+        loaded = self.frame(["AC Registration", col])
+        if index.size != len(loaded):
+            # a refresh landed in between
+            index = RegistrationIndex(loaded["AC Registration"], loaded[col])
+        return self.take(index.rows(registrations, start, end, closed=closed), columns)
+
+
+@st.cache_resource(show_spinner="Loading flight data...")
+def _open_store() -> FlightStore:
+    store = FlightStore(_source())
+    if store.empty:
+        st.error("No parquet files found in the specified directory!")
+    return store
+
+
+def get_store() -> FlightStore:
+    """The process-wide store, refreshed with newly ingested data when due."""
+    store = _open_store()
+    store.maybe_refresh()
+    return store
+
+
+# --------------------------------------------------------------------------------
+# Accessors
+# --------------------------------------------------------------------------------
+
+
+def day_window(start, end, margin=pd.Timedelta(0)) -> tuple[date, date]:
+    """The filed dates ``start``-``margin`` .. ``end``+``margin`` as a (first, last) pair."""
+    return (pd.Timestamp(start) - margin).date(), (pd.Timestamp(end) + margin).date()
+
+
+def slice_flights(col, start, end, page: str, days=None, closed="left") -> pd.DataFrame:
+    """The page's flights with ``col`` between ``start`` and ``end`` (see `FlightStore.slice_by_time`).
+
+    ``days`` restricts the search to a `day_window`, reading only its partitions.
+    """
+    return get_store().engine.slice_by_time(col, start, end, PAGE_COLUMNS[page], days=days,
+                                            closed=closed)
+
+
+def aircraft_flights(registrations, col, start, end, page: str, closed="left") -> pd.DataFrame:
+    """The page's flights of the aircraft ``registrations`` with ``col`` between ``start`` and ``end``.
+
+    See `FlightStore.aircraft_legs`; unlike `slice_flights` this searches the
+    whole history, not a day window.
+    """
+    return get_store().aircraft_legs(registrations, col, start, end, PAGE_COLUMNS[page],
+                                     closed=closed)
+
+
+def previous_legs(prev_legs, page: str) -> pd.DataFrame:
+    """The page's flights at the table rows ``prev_legs``, in that order.
+
+    ``prev_legs`` are PREV LEG values of some flights (see rotations.py);
+    flights without a previous leg (-1) are skipped. Only those rows are read
+    (see `FlightStore.take`).
+    """
+    rows = np.asarray(prev_legs, dtype=np.int64)
+    return get_store().take(rows[rows >= 0], PAGE_COLUMNS[page])
+
+
+class TimeWindow(NamedTuple):
+    """The flights the TimeWindow page shows for one selection (see `time_window`)."""
+
+    departures: pd.DataFrame  # leaving the airport in the departure interval
+    delayed: pd.DataFrame  # those delayed beyond the threshold
+    previous: pd.DataFrame  # their inbound legs to the airport, late by over 15 min
+    routes: pd.DataFrame  # every leg of those inbound aircraft since the previous interval began
+
+
+def _round_delays(frame: pd.DataFrame) -> pd.DataFrame:
+    return frame.assign(DEPTDEL=frame["DEPTDEL"].round(1), ARVLDEL=frame["ARVLDEL"].round(1))
+
+
+def time_window(airport: str, end, dep_hours: int, prev_hours: int, threshold) -> TimeWindow:
+    """The TimeWindow page's flights at ``airport`` up to ``end``, shared by all sessions.
+
+    Departures are those of the last ``dep_hours``; previous flights and routes
+    go back ``prev_hours``. Delays are rounded to one decimal, as the page
+    shows them. Departures keep their storage order; previous flights and
+    routes come newest first.
+    """
+    end = pd.Timestamp(end)
+    start_dep = end - pd.Timedelta(hours=dep_hours)
+    start_prev = end - pd.Timedelta(hours=prev_hours)
+    # A day of margin keeps flights filed for a neighbouring day whose actual
+    # times fall inside the window
+    days = day_window(start_prev, end, margin=pd.Timedelta(days=1))
+
+    def build():
+        departures = slice_flights("ACTUAL OFF BLOCK TIME", start_dep, end, "timewindow",
+                                   days=days, closed="both")
+        departures = _round_delays(departures[departures["ADEP"] == airport])
+        delayed = departures[departures["DEPTDEL"] > threshold]
+        if delayed.empty:
+            return TimeWindow(departures, delayed, delayed, delayed)
+        last_departure = delayed["ACTUAL OFF BLOCK TIME"].max()
+
+        previous = previous_legs(delayed["PREV LEG"], "timewindow")
+        previous = _round_delays(previous[
+            (previous["ADES"] == airport)
+            & previous["ACTUAL ARRIVAL TIME"].between(start_prev, last_departure)
+        ])
+        previous = previous[previous["ARVLDEL"] > 15].sort_values(
+            by="ACTUAL ARRIVAL TIME", ascending=False)
+
+        routes = aircraft_flights(previous["AC Registration"].unique(), "ACTUAL OFF BLOCK TIME",
+                                  start_prev, last_departure, "timewindow", closed="both")
+        routes = _round_delays(routes).sort_values(by="ACTUAL OFF BLOCK TIME", ascending=False)
+        return TimeWindow(departures, delayed, previous, routes)
+
+    return get_store().cached(("time_window", airport, end, dep_hours, prev_hours, threshold),
+                              build, days=days)
+
+
+def _delay_propagation() -> DelayPropagation:
+    store = get_store()
+    return store.index("delay_propagation",
+                       lambda: DelayPropagation(store.frame(PROPAGATION_COLUMNS)))
+
+
+def trace_delays(departures: pd.DataFrame, hops: int, since,
+                 min_turnaround=MIN_TURNAROUND) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Reactionary delay attribution of ``departures`` (see `DelayPropagation.trace`)."""
+    propagation = _delay_propagation()
+    if len(departures) and departures["PREV LEG"].max() >= propagation.size:
+        # a refresh landed in between
+        propagation = DelayPropagation(get_store().frame(PROPAGATION_COLUMNS))
+    return propagation.trace(departures, hops, since, min_turnaround)
+
+
+def airport_codes() -> list[str]:
+    store = get_store()
+
+    def build():
+        df = store.frame(['ADEP'])
+        return sorted(str(code) for code in df['ADEP'].dropna().unique()) if not df.empty else []
+
+    return store.cached("airport_codes", build)
+
+
+def airport_cities() -> pd.DataFrame:
+    """Distinct (ADEP, City) pairs as plain strings, sorted by airport code."""
+    store = get_store()
+
+    def build():
+        df = store.frame(['ADEP', 'City'])
+        if df.empty:
+            return pd.DataFrame(columns=['ADEP', 'City'])
+        return (df[['ADEP', 'City']].dropna().drop_duplicates().astype(str)
+                .sort_values('ADEP').reset_index(drop=True))
+
+    return store.cached("airport_cities", build)
+
+
+def filed_months() -> list[int]:
+    """Months (1-12) that have at least one filed off-block time."""
+    store = get_store()
+
+    def build():
+        months = store.frame(["DEP MONTH"])["DEP MONTH"].unique()
+        return sorted(int(m) for m in months if m > 0)
+
+    return store.cached("filed_months", build)
+
+
+def latest_filed_time() -> pd.Timestamp:
+    store = get_store()
+    return store.cached("latest_filed_time", lambda: store.frame(
+        ["FILED OFF BLOCK TIME"])["FILED OFF BLOCK TIME"].max())
+
+
+def overview_cube(first: date, last: date, airports=None) -> pd.DataFrame:
+    """Overview cube rows for flights filed ``first``..``last`` (see cube.py).
+
+    With ``airports``, only rows for departures from those airports.
+    """
+    rows = cube_days(get_store().cube(), first, last)
+    if airports:
+        rows = rows[rows["ADEP"].isin(airports)]
+    return rows
+
+
+def airport_places() -> pd.DataFrame:
+    """City and Country of each departure airport, indexed by ADEP."""
+    store = get_store()
+    return store.cached("airport_places", lambda: store.frame(['ADEP', 'City', 'Country'])
+                        .groupby('ADEP', observed=True)[['City', 'Country']].first())
+
+
+def _delay_index() -> DelayIndex:
+    store = get_store()
+    return store.index("delay_index", store.engine.delay_index)
+
+
+def _delay_counts(first: date, last: date, key: tuple):
+    index = _delay_index()
+    return get_store().cached(("delay_counts", first, last, key),
+                              lambda: index.range_counts(first, last, key), days=(first, last))
+
+
+def delay_counts(first: date, last: date, threshold, by="ADEP") -> pd.DataFrame:
+    """Departures and departures delayed more than ``threshold`` minutes per ``by`` value.
+
+    Covers flights filed ``first``..``last`` and is laid out like
+    ``groupby(by, observed=True)`` with ``total_departures`` and
+    ``delayed_flights`` columns. Answered from the DelayIndex, so a new
+    threshold costs no scan.
+    """
+    key = (by,) if isinstance(by, str) else tuple(by)
+    return delay_table(*_delay_counts(first, last, key), threshold)
+
+
+def delay_summary(first: date, last: date, threshold) -> DelaySummary:
+    """Per-airport, per-airline and per-(Country, City) delay tables plus totals.
+
+    Memoized per (dates, threshold) and shared by all sessions; treat the
+    tables as read-only.
+    """
+    index = _delay_index()
+    return get_store().cached(("delay_summary", first, last, threshold),
+                              lambda: summarize_delays(index, first, last, threshold),
+                              days=(first, last))
+
+
+def delay_totals(first: date, last: date, threshold, airports=None) -> tuple[int, int]:
+    """(departures, departures delayed more than ``threshold``) filed ``first``..``last``.
+
+    With ``airports``, only departures from those airports are counted.
+    """
+    return delay_summary(first, last, threshold).totals(airports)
+
+
+def _hourly_delays() -> HourlyDelays:
+    store = get_store()
+    return store.index("hourly_delays", store.engine.hourly_delays)
+
+
+def hourly_delays(col: str, airport: str, day: date) -> np.ndarray:
+    """Mean positive ``col`` delay at ``airport`` on ``day`` for each hour of HOUR_ORDERS.
+
+    ``col`` is DEPTDEL (by filed off-block date) or ARVLDEL (by filed
+    arrival date); hours without a positive delay are NaN. Sliced from the
+    HourlyDelays tensor, so each profile costs no scan.
+    """
+    return _hourly_delays().profile(col, airport, day)
+
+
+def _monthly_delays() -> MonthlyDelays:
+    store = get_store()
+    return store.index("monthly_delays", lambda: MonthlyDelays(store.daily_delays()))
+
+
+def daily_delays(col: str, airport: str, month: int) -> np.ndarray:
+    """Mean positive ``col`` delay at ``airport`` on each day 1..31 of ``month``.
+
+    ``col`` is DEPTDEL (by filed off-block date) or ARVLDEL (by filed arrival
+    date); days without a positive delay are NaN. Sliced from the
+    MonthlyDelays matrix, so each profile costs no scan.
+    """
+    return _monthly_delays().profile(col, airport, month)
+
+
+def _delay_sketches() -> DelaySketches:
+    store = get_store()
+    return store.index("delay_sketches", lambda: DelaySketches(store.sketches()))
+
+
+def delay_quantiles(first: date, last: date, col="DEPTDEL", airports=None) -> dict[str, float]:
+    """QUANTILES of delay ``col`` over flights filed ``first``..``last``, by label.
+
+    Read from the merged quantile sketches, so each is within SKETCH_ACCURACY
+    of the exact value; only ``airports`` if given.
+    """
+    sketches = _delay_sketches()
+    key = ("delay_quantiles", first, last, col, tuple(airports or ()))
+    values = get_store().cached(key, lambda: sketches.quantiles(
+        col, first, last, list(QUANTILES.values()), airports), days=(first, last))
+    return dict(zip(QUANTILES, values))
+
+
+def hourly_delay_quantile(col: str, airport: str, day: date, quantile: float) -> np.ndarray:
+    """Like `hourly_delays`, but the ``quantile`` of the positive delays in each hour."""
+    sketches = _delay_sketches()
+    return get_store().cached(("hourly_delay_quantile", col, airport, day, quantile),
+                              lambda: sketches.hourly(col, airport, day, quantile),
+                              days=(day, day))
+
+
+def daily_delay_quantile(col: str, airport: str, month: int, quantile: float) -> np.ndarray:
+    """Like `daily_delays`, but the ``quantile`` of the positive delays on each day."""
+    sketches = _delay_sketches()
+    return get_store().cached(("daily_delay_quantile", col, airport, month, quantile),
+                              lambda: sketches.daily(col, airport, month, quantile))
+
+
+def delay_means(first: date, last: date, airports=None) -> tuple[float, float]:
+    """Mean departure and arrival delay of flights filed ``first``..``last`` (NaN if none).
+
+    With ``airports``, only departures from those airports are counted.
+    Answered from the DelayIndex's running sums, so any date range costs two
+    lookups.
+    """
+    keys, sums = _delay_index().range_sums(first, last, ("ADEP",))
+    if airports:
+        sums = sums[:-1][keys["ADEP"].isin(airports).to_numpy()]
+    totals = sums.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = totals[1::2] / totals[0::2]
+    return float(means[0]), float(means[1])
+
+
+def airport_conditions(day: date) -> pd.DataFrame:
+    """Location, city and weather of each departure airport on ``day``, indexed by ADEP.
+
+    Taken from each airport's first flight record in the day's partition,
+    once per day.
+    """
+    store = get_store()
+
+    def build():
+        df = store.days(day, day, PAGE_COLUMNS["heatmap"])
+        return df.groupby('ADEP', observed=True).agg(
+            latitude=('ADEP Latitude', 'first'),
+            longitude=('ADEP Longitude', 'first'),
+            city=('City', 'first'),
+            prcp=('prcp', 'first'),
+            tavg=('tavg', 'first'),
+            snow=('snow', 'first'),
+        )
+
+    return store.cached(("airport_conditions", day), build, days=(day, day))
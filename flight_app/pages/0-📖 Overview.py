@@ -1,12 +1,13 @@
 import streamlit as st
-import pandas as pd
-import glob
-import os
 import altair as alt
 import numpy as np
 import plotly.express as px
 from datetime import datetime
 
+from flightdata import (BRACKET_EDGE_CHOICES, DELAY_BRACKET_EDGES, airport_codes,
+                        airport_places, cube_hourly, delay_counts, delay_means, delay_quantiles,
+                        delay_totals, overview_cube, top_rows)
+
 # --------------------------------------------------------------------------------
 # 1) Page Setup
 # --------------------------------------------------------------------------------
@@ -45,36 +46,7 @@ st.markdown(
 )
 
 # --------------------------------------------------------------------------------
-# 2) Load Data
-# --------------------------------------------------------------------------------
-
-
-@st.cache_data
-def load_data():
-    path = "flight_app/data"
-    parquet_files = glob.glob(os.path.join(path, '*.parquet'))
-    if not parquet_files:
-        st.error("No parquet files found in the specified directory!")
-        return pd.DataFrame()
-    df = pd.concat([pd.read_parquet(file)
-                   for file in parquet_files], ignore_index=True)
-    date_format = "%d-%m-%Y %H:%M:%S"
-    time_cols = ["FILED OFF BLOCK TIME", "ACTUAL OFF BLOCK TIME",
-                 "FILED ARRIVAL TIME", "ACTUAL ARRIVAL TIME"]
-    for col in time_cols:
-        df[col] = pd.to_datetime(df[col], format=date_format, errors='coerce')
-    # Compute delays in minutes
-    df['DEPTDEL'] = (df["ACTUAL OFF BLOCK TIME"] -
-                     df["FILED OFF BLOCK TIME"]).dt.total_seconds() / 60
-    df['ARVLDEL'] = (df["ACTUAL ARRIVAL TIME"] -
-                     df["FILED ARRIVAL TIME"]).dt.total_seconds() / 60
-    return df
-
-
-df = load_data()
-
-# --------------------------------------------------------------------------------
-# 3) Sidebar Controls
+# 2) Sidebar Controls
 # --------------------------------------------------------------------------------
 st.sidebar.header("Filters")
 
@@ -88,31 +60,34 @@ if start_date > end_date:
 
 delay_threshold = st.sidebar.slider(
     "Delay Threshold (minutes)", min_value=15, max_value=60, value=15, step=15)
-airport_options = sorted(df['ADEP'].dropna().unique()) if not df.empty else []
+airport_options = airport_codes()
 selected_airports = st.sidebar.multiselect(
     "Select Airport(s) (leave empty for all)", options=airport_options)
+bracket_edges = sorted(st.sidebar.multiselect(
+    "Delay Bracket Edges (minutes)", options=BRACKET_EDGE_CHOICES, default=DELAY_BRACKET_EDGES))
 
 # Number of airports to display in scatter plot
 n_display = st.sidebar.slider(
     "Number of Airports to Display (Scatter Plot)", min_value=5, max_value=25, value=10, step=5)
 
 # --------------------------------------------------------------------------------
-# 4) Data Filtering
+# 3) Load Data
 # --------------------------------------------------------------------------------
-df_filtered = df[(df["FILED OFF BLOCK TIME"].dt.date >= start_date) &
-                 (df["FILED OFF BLOCK TIME"].dt.date <= end_date)]
-if selected_airports:
-    df_filtered = df_filtered[df_filtered['ADEP'].isin(selected_airports)]
+# Rows of the pre-aggregated Overview cube for the selected dates (end date
+# inclusive) and airports; no individual flights are scanned
+cube = overview_cube(start_date, end_date, selected_airports)
 
 # --------------------------------------------------------------------------------
-# 5) Key Metrics (Cards)
+# 4) Key Metrics (Cards)
 # --------------------------------------------------------------------------------
-num_departures = len(df_filtered)
-num_delayed = df_filtered[df_filtered['DEPTDEL'] > delay_threshold].shape[0]
+# Counts come from the delay index, so moving the threshold slider scans nothing
+num_departures, num_delayed = delay_totals(
+    start_date, end_date, delay_threshold, selected_airports)
 delayed_percentage = (num_delayed / num_departures *
                       100) if num_departures > 0 else 0
-avg_dep_delay = df_filtered['DEPTDEL'].mean() if num_departures > 0 else 0
-avg_arr_delay = df_filtered['ARVLDEL'].mean() if num_departures > 0 else 0
+# So do the mean delays, from its running delay sums
+avg_dep_delay, avg_arr_delay = delay_means(
+    start_date, end_date, selected_airports) if num_departures > 0 else (0, 0)
 
 col1, col2, col3, col4, col5 = st.columns(5)
 with col1:
@@ -131,29 +106,29 @@ with col5:
     st.markdown(
         f"<div class='card'><h4>Avg Arr Delay (min)</h4><p>{avg_arr_delay:.1f}</p></div>", unsafe_allow_html=True)
 
+# Departure delay percentiles, merged from the quantile sketches (within 1%)
+dep_quantiles = delay_quantiles(start_date, end_date, "DEPTDEL", selected_airports)
+for column, (label, value) in zip(st.columns(len(dep_quantiles)), dep_quantiles.items()):
+    with column:
+        st.markdown(
+            f"<div class='card'><h4>{label.upper()} Dep Delay (min)</h4><p>{np.nan_to_num(value):.1f}</p></div>", unsafe_allow_html=True)
+
 # --------------------------------------------------------------------------------
-# 6) Top 5 Delayed Airports and Airlines (Horizontal Bars)
+# 5) Top 5 Delayed Airports and Airlines (Horizontal Bars)
 # --------------------------------------------------------------------------------
 st.markdown("---")
 st.subheader("Top 5 Delayed Airports and Top 5 Delayed Airlines")
 
-# Filter by date only (ignore selected airport filter) for these charts
-df_date_filtered = df[(df["FILED OFF BLOCK TIME"].dt.date >= start_date) &
-                      (df["FILED OFF BLOCK TIME"].dt.date <= end_date)].copy()
+# These charts ignore the selected airports
 
 # --- Airports ---
-# Now include City and Country from the first record per airport.
-airport_delays = df_date_filtered.groupby("ADEP").agg(
-    total_departures=("ADEP", "count"),
-    delayed_flights=("DEPTDEL", lambda x: (x > delay_threshold).sum()),
-    City=("City", "first"),
-    Country=("Country", "first")
-).reset_index()
+# Now include City and Country of each airport.
+airport_delays = delay_counts(start_date, end_date, delay_threshold, "ADEP").join(
+    airport_places(), on="ADEP")
 airport_delays['Delay %'] = airport_delays['delayed_flights'] / \
     airport_delays['total_departures'] * 100
 # Sort descending so that the most delayed is on top
-top5_airports = airport_delays.sort_values(
-    "delayed_flights", ascending=False).head(5)
+top5_airports = top_rows(airport_delays, "delayed_flights", 5)
 top5_airports = top5_airports.rename(columns={"ADEP": "Airport"})
 
 fig_airports = px.bar(
@@ -181,14 +156,10 @@ fig_airports.update_traces(
     customdata=top5_airports[['City', 'Country']].values)
 
 # --- Airlines ---
-airline_delays = df_date_filtered.groupby("AC Operator").agg(
-    total_departures=("AC Operator", "count"),
-    delayed_flights=("DEPTDEL", lambda x: (x > delay_threshold).sum())
-).reset_index()
+airline_delays = delay_counts(start_date, end_date, delay_threshold, "AC Operator")
 airline_delays['Delay %'] = airline_delays['delayed_flights'] / \
     airline_delays['total_departures'] * 100
-top5_airlines = airline_delays.sort_values(
-    "delayed_flights", ascending=False).head(5)
+top5_airlines = top_rows(airline_delays, "delayed_flights", 5)
 top5_airlines = top5_airlines.rename(columns={"AC Operator": "Airline"})
 
 fig_airlines = px.bar(
@@ -217,28 +188,14 @@ with col_bar2:
     st.plotly_chart(fig_airlines, use_container_width=True)
 
 # --------------------------------------------------------------------------------
-# 7) Departure Delay Over Time Plot by Brackets (Altair)
+# 6) Departure Delay Over Time Plot by Brackets (Altair)
 # --------------------------------------------------------------------------------
 st.markdown("---")
 st.subheader("Departure Delay Over Time by Delay Brackets")
 
-
-def assign_delay_bracket(delay):
-    if delay < 15:
-        return "0-15"
-    elif delay < 30:
-        return "15-30"
-    elif delay < 90:
-        return "30-90"
-    else:
-        return "90+"
-
-
-df_plot = df_filtered.copy()
-df_plot['Delay Bracket'] = df_plot['DEPTDEL'].apply(assign_delay_bracket)
-df_plot['TimeBin'] = df_plot["FILED OFF BLOCK TIME"].dt.floor("H")
-time_bracket = df_plot.groupby(
-    ["TimeBin", "Delay Bracket"]).size().reset_index(name="Count")
+# Hourly flight counts per 'Delay Bracket' on the selected edges (default
+# 0-15/15-30/30-90/90+), rebinned from the cube's delay bins
+time_bracket = cube_hourly(cube, bracket_edges)
 
 # Use 'basis' interpolation to soften the curves
 chart = alt.Chart(time_bracket).mark_line(point=True, interpolate='basis').encode(
@@ -254,14 +211,13 @@ chart = alt.Chart(time_bracket).mark_line(point=True, interpolate='basis').encod
 st.altair_chart(chart, use_container_width=True)
 
 # --------------------------------------------------------------------------------
-# 8) Scatter Plot: Total Departures vs. Delayed Flights by Airport
+# 7) Scatter Plot: Total Departures vs. Delayed Flights by Airport
 # --------------------------------------------------------------------------------
 st.markdown("---")
 st.subheader("Scatter Plot: Departures vs. Delayed Flights by Airport")
 
 scatter_data = airport_delays.copy().rename(columns={"ADEP": "Airport"})
-scatter_data = scatter_data.sort_values(
-    "total_departures", ascending=False).head(n_display)
+scatter_data = top_rows(scatter_data, "total_departures", n_display)
 
 fig_scatter = px.scatter(
     scatter_data,
@@ -1,54 +1,21 @@
 import streamlit as st
 import pandas as pd
-import glob
-import os
 import calendar
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
 
+from flightdata import (HOUR_ORDERS, QUANTILES, airport_cities, daily_delay_quantile,
+                        daily_delays, filed_months, hourly_delay_quantile, hourly_delays,
+                        latest_filed_time)
+
 # --------------------------------------------------------------------------------
 # 1) Page Setup
 # --------------------------------------------------------------------------------
 st.set_page_config(layout="wide")
 
 # --------------------------------------------------------------------------------
-# 2) Load Data
-# --------------------------------------------------------------------------------
-
-
-@st.cache_data
-def load_data():
-    path = "flight_app/data"
-    parquet_files = glob.glob(os.path.join(path, '*.parquet'))
-    if not parquet_files:
-        st.error("No parquet files found in the specified directory!")
-        return pd.DataFrame()
-    df = pd.concat([pd.read_parquet(file)
-                   for file in parquet_files], ignore_index=True)
-
-    date_format = "%d-%m-%Y %H:%M:%S"
-    # Convert departure times
-    for col in ["FILED OFF BLOCK TIME", "ACTUAL OFF BLOCK TIME"]:
-        df[col] = pd.to_datetime(df[col], format=date_format, errors='coerce')
-    # Convert arrival times
-    for col in ["FILED ARRIVAL TIME", "ACTUAL ARRIVAL TIME"]:
-        df[col] = pd.to_datetime(df[col], format=date_format, errors='coerce')
-
-    df = df.dropna(subset=["FILED OFF BLOCK TIME", "FILED ARRIVAL TIME"])
-
-    # Compute delays (in minutes)
-    df['DEPTDEL'] = (df["ACTUAL OFF BLOCK TIME"] -
-                     df["FILED OFF BLOCK TIME"]).dt.total_seconds() / 60
-    df['ARVLDEL'] = (df["ACTUAL ARRIVAL TIME"] -
-                     df["FILED ARRIVAL TIME"]).dt.total_seconds() / 60
-    return df
-
-
-df = load_data()
-
-# --------------------------------------------------------------------------------
-# 3) Sidebar Controls & Comparison Mode Selection
+# 2) Sidebar Controls & Comparison Mode Selection
 # --------------------------------------------------------------------------------
 st.sidebar.title("Filters")
 
@@ -56,11 +23,16 @@ st.sidebar.title("Filters")
 comparison_mode = st.sidebar.radio(
     "Comparison Mode", options=["Daily", "Monthly"])
 
+# Statistic of the positive delays: their mean, or a percentile read from the
+# delay sketches (within 1% of the exact value)
+statistic = st.sidebar.selectbox(
+    "Statistic", options=["Mean"] + list(QUANTILES))
+statistic_label = "Average" if statistic == "Mean" else statistic.upper()
+
 # Airport selection by city: show as "CODE (City)"
-airport_df = df[['ADEP', 'City']].dropna(
-    subset=['ADEP', 'City']).drop_duplicates()
-airport_df["option"] = airport_df["ADEP"].astype(
-    str) + " (" + airport_df["City"].astype(str) + ")"
+airport_df = airport_cities()
+airport_df = airport_df.assign(option=airport_df["ADEP"].astype(
+    str) + " (" + airport_df["City"].astype(str) + ")")
 airport_options = sorted(airport_df["option"].unique(), key=lambda x: str(x))
 selected_airports = st.sidebar.multiselect(
     "Select Airport(s)", options=airport_options)
@@ -71,12 +43,12 @@ if not selected_airports:
 selected_airport_codes = [option.split()[0] for option in selected_airports]
 
 # --------------------------------------------------------------------------------
-# 4) Hourly (Daily) Mode Setup
+# 3) Hourly (Daily) Mode Setup
 # --------------------------------------------------------------------------------
 if comparison_mode == "Daily":
     # Rename sidebar label to reflect daily selection
     selected_dates = st.sidebar.date_input("Select Daily Date(s)", value=[
-                                           df["FILED OFF BLOCK TIME"].max().date() - pd.Timedelta(days=1)])
+                                           latest_filed_time().date() - pd.Timedelta(days=1)])
     if not isinstance(selected_dates, (list, tuple)):
         selected_dates = [selected_dates]
     elif len(selected_dates) == 1 and isinstance(selected_dates[0], tuple):
@@ -86,36 +58,14 @@ if comparison_mode == "Daily":
     selected_dates = sorted(selected_dates)
 
     # Custom hour ordering: x-axis spans from 04 to 03
-    custom_hours = list(range(4, 24)) + list(range(24, 28))
+    custom_hours = HOUR_ORDERS
     custom_labels = [f"{h:02d}" if h <
                      24 else f"{h-24:02d}" for h in custom_hours]
 
-    # Functions to compute hourly averages
-    def get_hourly_avg_dep_delay(df, date, airport):
-        date = pd.Timestamp(date)
-        subset = df[(df["FILED OFF BLOCK TIME"].dt.date ==
-                     date.date()) & (df["ADEP"] == airport)].copy()
-        subset = subset[subset["DEPTDEL"] > 0]
-        subset['Hour'] = subset["FILED OFF BLOCK TIME"].dt.hour.astype(int)
-        subset['Hour_order'] = subset['Hour'].apply(
-            lambda x: x if x >= 4 else x + 24)
-        hourly = subset.groupby("Hour_order")["DEPTDEL"].mean().reset_index()
-        hourly['Time'] = hourly['Hour_order'].apply(
-            lambda x: f"{x if x < 24 else x-24:02d}")
-        return hourly.sort_values("Hour_order")
-
-    def get_hourly_avg_arr_delay(df, date, airport):
-        date = pd.Timestamp(date)
-        subset = df[(df["FILED ARRIVAL TIME"].dt.date == date.date())
-                    & (df["ADEP"] == airport)].copy()
-        subset = subset[subset["ARVLDEL"] > 0]
-        subset['Hour'] = subset["FILED ARRIVAL TIME"].dt.hour.astype(int)
-        subset['Hour_order'] = subset['Hour'].apply(
-            lambda x: x if x >= 4 else x + 24)
-        hourly = subset.groupby("Hour_order")["ARVLDEL"].mean().reset_index()
-        hourly['Time'] = hourly['Hour_order'].apply(
-            lambda x: f"{x if x < 24 else x-24:02d}")
-        return hourly.sort_values("Hour_order")
+    def hourly_statistic(col, airport, day):
+        if statistic == "Mean":
+            return hourly_delays(col, airport, day)
+        return hourly_delay_quantile(col, airport, day, QUANTILES[statistic])
 
     # Determine dash styles and marker symbols based on date order
     dash_styles = {}
@@ -141,17 +91,12 @@ if comparison_mode == "Daily":
     for airport in selected_airport_codes:
         for d in selected_dates:
             date_str = pd.Timestamp(d).strftime("%Y-%m-%d")
-            hourly_data = get_hourly_avg_dep_delay(df, d, airport)
-            # Merge with full set of hours to ensure all hours (04 to 03) appear
-            full_hours_df = pd.DataFrame(
-                {"Hour_order": custom_hours, "Time": custom_labels})
-            hourly_data = pd.merge(full_hours_df, hourly_data, on=[
-                                   "Hour_order", "Time"], how="left")
-            hourly_data = hourly_data.sort_values("Hour_order")
+            # One value per hour (04 to 03); hours without delays are NaN
+            hourly_delay = hourly_statistic("DEPTDEL", airport, d)
             fig_dep.add_trace(
                 go.Scatter(
-                    x=hourly_data["Hour_order"],
-                    y=hourly_data["DEPTDEL"],
+                    x=custom_hours,
+                    y=hourly_delay,
                     mode="lines+markers",
                     name=f"{airport} - {date_str}",
                     line=dict(
@@ -177,7 +122,7 @@ if comparison_mode == "Daily":
             ticktext=custom_labels,
             title="Hour (4:00 Am to 3:00 Am next Day)"
         ),
-        yaxis=dict(title="Average Departure Delay (min)"),
+        yaxis=dict(title=f"{statistic_label} Departure Delay (min)"),
         title="Daily Departure Delay Comparison",
         hovermode="x unified"
     )
@@ -187,16 +132,12 @@ if comparison_mode == "Daily":
     for airport in selected_airport_codes:
         for d in selected_dates:
             date_str = pd.Timestamp(d).strftime("%Y-%m-%d")
-            hourly_data = get_hourly_avg_arr_delay(df, d, airport)
-            full_hours_df = pd.DataFrame(
-                {"Hour_order": custom_hours, "Time": custom_labels})
-            hourly_data = pd.merge(full_hours_df, hourly_data, on=[
-                                   "Hour_order", "Time"], how="left")
-            hourly_data = hourly_data.sort_values("Hour_order")
+            # One value per hour (04 to 03); hours without delays are NaN
+            hourly_delay = hourly_statistic("ARVLDEL", airport, d)
             fig_arr.add_trace(
                 go.Scatter(
-                    x=hourly_data["Hour_order"],
-                    y=hourly_data["ARVLDEL"],
+                    x=custom_hours,
+                    y=hourly_delay,
                     mode="lines+markers",
                     name=f"{airport} - {date_str}",
                     line=dict(
@@ -222,7 +163,7 @@ if comparison_mode == "Daily":
             ticktext=custom_labels,
             title="Hour (4:00 Am to 3:00 Am next Day)"
         ),
-        yaxis=dict(title="Average Arrival Delay (min)"),
+        yaxis=dict(title=f"{statistic_label} Arrival Delay (min)"),
         title="Daily Arrival Delay Comparison",
         hovermode="x unified"
     )
@@ -231,12 +172,12 @@ if comparison_mode == "Daily":
     st.plotly_chart(fig_arr, use_container_width=True)
 
 # --------------------------------------------------------------------------------
-# 5) Monthly Mode Setup
+# 4) Monthly Mode Setup
 # --------------------------------------------------------------------------------
 elif comparison_mode == "Monthly":
     # For monthly mode, let the user select one or two months (with year shown as "2018 - MM")
     available_months = [
-        f"2018 - {month:02d}" for month in sorted(df["FILED OFF BLOCK TIME"].dt.month.unique())]
+        f"2018 - {month:02d}" for month in filed_months()]
     selected_months = st.sidebar.multiselect(
         "Select Month(s)", options=available_months, default=[available_months[-1]])
     if not selected_months:
@@ -249,24 +190,12 @@ elif comparison_mode == "Monthly":
     # Determine common x-axis range: days 1 to min(max_day for each selected month)
     max_days = {m: calendar.monthrange(2018, m)[1] for m in parsed_months}
     overall_max_day = min(max_days.values())
-    full_days = pd.DataFrame({"Day": list(range(1, overall_max_day + 1))})
-
-    # --- UPDATED FUNCTIONS: now filter by airport ---
-    def get_daily_avg_dep_delay(df, month, airport):
-        subset = df[(df["FILED OFF BLOCK TIME"].dt.month == month)
-                    & (df["ADEP"] == airport)].copy()
-        subset = subset[subset["DEPTDEL"] > 0]
-        subset["Day"] = subset["FILED OFF BLOCK TIME"].dt.day.astype(int)
-        daily = subset.groupby("Day")["DEPTDEL"].mean().reset_index()
-        return daily
+    common_days = list(range(1, overall_max_day + 1))
 
-    def get_daily_avg_arr_delay(df, month, airport):
-        subset = df[(df["FILED ARRIVAL TIME"].dt.month == month)
-                    & (df["ADEP"] == airport)].copy()
-        subset = subset[subset["ARVLDEL"] > 0]
-        subset["Day"] = subset["FILED ARRIVAL TIME"].dt.day.astype(int)
-        daily = subset.groupby("Day")["ARVLDEL"].mean().reset_index()
-        return daily
+    def daily_statistic(col, airport, month):
+        if statistic == "Mean":
+            return daily_delays(col, airport, month)
+        return daily_delay_quantile(col, airport, month, QUANTILES[statistic])
 
     # Determine dash styles and marker symbols for months (earlier month dashed)
     dash_styles_month = {}
@@ -294,18 +223,12 @@ elif comparison_mode == "Monthly":
         m = int(option.split("-")[1].strip())
         for airport in selected_airport_codes:
             m_str = option  # e.g. "2018 - 03"
-            daily_data = get_daily_avg_dep_delay(df, m, airport)
-            # Create full days for this month
-            full_days_month = pd.DataFrame(
-                {"Day": list(range(1, calendar.monthrange(2018, m)[1] + 1))})
-            daily_data = pd.merge(
-                full_days_month, daily_data, on="Day", how="left")
-            # Restrict to common days among selected months (overall_max_day)
-            daily_data = daily_data[daily_data["Day"] <= overall_max_day]
+            # Daily means of this month over the common days
+            daily_delay = daily_statistic("DEPTDEL", airport, m)[:overall_max_day]
             fig_dep_month.add_trace(
                 go.Scatter(
-                    x=daily_data["Day"],
-                    y=daily_data["DEPTDEL"],
+                    x=common_days,
+                    y=daily_delay,
                     mode="lines+markers",
                     name=f"{airport} - {m_str}",
                     line=dict(
@@ -331,7 +254,7 @@ elif comparison_mode == "Monthly":
             range=[1, overall_max_day],
             title="Day of Month"
         ),
-        yaxis=dict(title="Average Departure Delay (min)"),
+        yaxis=dict(title=f"{statistic_label} Departure Delay (min)"),
         title="Monthly Departure Delay Comparison",
         hovermode="x unified"
     )
@@ -342,16 +265,12 @@ elif comparison_mode == "Monthly":
         m = int(option.split("-")[1].strip())
         for airport in selected_airport_codes:
             m_str = option
-            daily_data = get_daily_avg_arr_delay(df, m, airport)
-            full_days_month = pd.DataFrame(
-                {"Day": list(range(1, calendar.monthrange(2018, m)[1] + 1))})
-            daily_data = pd.merge(
-                full_days_month, daily_data, on="Day", how="left")
-            daily_data = daily_data[daily_data["Day"] <= overall_max_day]
+            # Daily means of this month over the common days
+            daily_delay = daily_statistic("ARVLDEL", airport, m)[:overall_max_day]
             fig_arr_month.add_trace(
                 go.Scatter(
-                    x=daily_data["Day"],
-                    y=daily_data["ARVLDEL"],
+                    x=common_days,
+                    y=daily_delay,
                     mode="lines+markers",
                     name=f"{airport} - {m_str}",
                     line=dict(
@@ -377,7 +296,7 @@ elif comparison_mode == "Monthly":
             range=[1, overall_max_day],
             title="Day of Month"
         ),
-        yaxis=dict(title="Average Arrival Delay (min)"),
+        yaxis=dict(title=f"{statistic_label} Arrival Delay (min)"),
         title="Monthly Arrival Delay Comparison",
         hovermode="x unified"
     )
@@ -6,8 +6,8 @@ import matplotlib.colors as mcolors
 import matplotlib.pyplot as plt
 from streamlit_folium import folium_static
 import plotly.graph_objects as go
-import os
-import glob
+
+from flightdata import airport_codes, airport_conditions, delay_summary, top_rows
 
 
 # --------------------------------------------------------------------------------
@@ -29,34 +29,7 @@ st.markdown(
 )
 
 # --------------------------------------------------------------------------------
-# 2) Load Data
-# --------------------------------------------------------------------------------
-
-
-@st.cache_data
-def load_data():
-    path = "flight_app/data"
-    parquet_files = glob.glob(os.path.join(path, '*.parquet'))
-    if not parquet_files:
-        st.error("No parquet files found in the specified directory!")
-        return pd.DataFrame()
-    df = pd.concat([pd.read_parquet(file)
-                   for file in parquet_files], ignore_index=True)
-    date_format = "%d-%m-%Y %H:%M:%S"
-    for col in ["FILED OFF BLOCK TIME", "ACTUAL OFF BLOCK TIME", "FILED ARRIVAL TIME", "ACTUAL ARRIVAL TIME"]:
-        df[col] = pd.to_datetime(df[col], format=date_format, errors='coerce')
-    df['DEPTDEL'] = (df["ACTUAL OFF BLOCK TIME"] -
-                     df["FILED OFF BLOCK TIME"]).dt.total_seconds() / 60
-    df['ARVLDEL'] = (df["ACTUAL ARRIVAL TIME"] -
-                     df["FILED ARRIVAL TIME"]).dt.total_seconds() / 60
-    # NOTE: The cleaning section has been removed since the data is already pre-cleaned.
-    return df
-
-
-df = load_data()
-
-# --------------------------------------------------------------------------------
-# 3) Sidebar Controls
+# 2) Sidebar Controls
 # --------------------------------------------------------------------------------
 st.sidebar.title("Filters")
 selected_date = st.sidebar.date_input(
@@ -76,7 +49,15 @@ top_table_rows = st.sidebar.slider(
     "Number Of Top Airports/Airlines", min_value=5, max_value=10, value=5, step=5)
 # Optional airport filter (affects only the map)
 selected_airports = st.sidebar.multiselect(
-    "Select Airport(s)", options=sorted(df['ADEP'].unique()))
+    "Select Airport(s)", options=airport_codes())
+
+# --------------------------------------------------------------------------------
+# 3) Load Data
+# --------------------------------------------------------------------------------
+# Every delay table and the donut totals come from one summary, memoized per
+# (date, threshold) and answered from the delay index; airport locations and
+# weather are taken from the day's partition once per date (shared, read-only)
+summary = delay_summary(selected_date, selected_date, threshold_minutes)
 
 # --------------------------------------------------------------------------------
 # 4) Map Generation Function
@@ -84,37 +65,21 @@ selected_airports = st.sidebar.multiselect(
 
 
 def plot_flight_delays(date, threshold, top_airports_count, min_flights_threshold, selected_airports=None):
-    date = pd.to_datetime(date)
-    filtered_df = df[(df["FILED OFF BLOCK TIME"] >= date) &
-                     (df["FILED OFF BLOCK TIME"] < date + pd.Timedelta(days=1))].copy()
+    airport_counts = delay_summary(date, date, threshold).airports.set_index("ADEP")
     if selected_airports:
-        filtered_df = filtered_df[filtered_df['ADEP'].isin(selected_airports)]
-    filtered_df['DelayedCalc'] = filtered_df['DEPTDEL'] > threshold
+        airport_counts = airport_counts[airport_counts.index.isin(selected_airports)]
 
-    # Include weather columns in the aggregation (using 'first' as aggregation method)
+    # Include location and weather (first record per airport)
     airport_stats = (
-        filtered_df.groupby('ADEP')
-        .agg(
-            delayed_flights=('DelayedCalc', 'sum'),
-            total_departures=('ADEP', 'count'),
-            latitude=('ADEP Latitude', 'first'),
-            longitude=('ADEP Longitude', 'first'),
-            city=('City', 'first'),
-            prcp=('prcp', 'first'),
-            tavg=('tavg', 'first'),
-            snow=('snow', 'first')
-        )
+        airport_counts[['delayed_flights', 'total_departures']]
+        .join(airport_conditions(date), how='inner')
         .dropna(subset=['latitude', 'longitude'])
     )
     airport_stats = airport_stats[airport_stats['total_departures']
                                   >= min_flights_threshold]
     airport_stats = airport_stats[airport_stats['delayed_flights'] > 0]
-    airport_stats = airport_stats.sort_values(
-        'delayed_flights', ascending=False)
-    if top_airports_count is not None:
-        top_airports = airport_stats.head(top_airports_count).reset_index()
-    else:
-        top_airports = airport_stats.reset_index()
+    top_airports = top_rows(airport_stats, 'delayed_flights',
+                            top_airports_count).reset_index()
 
     flight_map = folium.Map(
         location=[38.8566, 0.3522], zoom_start=2.3, tiles=None)
@@ -209,21 +174,14 @@ def plot_flight_delays(date, threshold, top_airports_count, min_flights_threshol
 
 
 # --------------------------------------------------------------------------------
-# 5) Filter Data for the Map (using selected airports)
+# 5) Delay Counts for the Map (using selected airports)
 # --------------------------------------------------------------------------------
-date_filter = pd.to_datetime(selected_date)
-subset_df = df[(df["FILED OFF BLOCK TIME"] >= date_filter) &
-               (df["FILED OFF BLOCK TIME"] < date_filter + pd.Timedelta(days=1))].copy()
-if selected_airports:
-    subset_df = subset_df[subset_df['ADEP'].isin(selected_airports)]
-subset_df['DelayedCalc'] = subset_df['DEPTDEL'] > threshold_minutes
+total_count, delayed_count = summary.totals(selected_airports)
 
 # --------------------------------------------------------------------------------
 # 6) Donut Chart (for Flight Status)
 # --------------------------------------------------------------------------------
 # Create a compact donut chart of constant size 150x150 pixels (figsize=(1.5,1.5))
-delayed_count = subset_df['DelayedCalc'].sum()
-total_count = len(subset_df)
 on_time_count = total_count - delayed_count
 fig_donut, ax_donut = plt.subplots(figsize=(.8, .8))
 
@@ -251,53 +209,22 @@ else:
 # --------------------------------------------------------------------------------
 # 7) Prepare Top Airports & Top Airlines Tables (for the entire day, ignoring selected airports)
 # --------------------------------------------------------------------------------
-table_subset = df[(df["FILED OFF BLOCK TIME"] >= date_filter) &
-                  (df["FILED OFF BLOCK TIME"] < date_filter + pd.Timedelta(days=1))].copy()
-table_subset['DelayedCalc'] = table_subset['DEPTDEL'] > threshold_minutes
-
 # Top Airports Table: Separate columns for Delayed Flights and Total Departures
-airport_stats_chart = (
-    table_subset.groupby('ADEP')
-    .agg(
-        delayed_flights=('DelayedCalc', 'sum'),
-        total_departures=('ADEP', 'count')
-    )
-    .reset_index()
-)
-airport_stats_chart = airport_stats_chart.sort_values(
-    'delayed_flights', ascending=False).head(top_table_rows)
+airport_stats_chart = top_rows(summary.airports, 'delayed_flights', top_table_rows)
 airport_stats_chart['delayed_rate'] = (
     airport_stats_chart['delayed_flights'] / airport_stats_chart['total_departures'] * 100)
 airport_stats_chart = airport_stats_chart[[
     'ADEP', 'delayed_flights', 'total_departures', 'delayed_rate']]
 
 # Top Airlines Table: Separate columns for Delayed Flights and Total Departures
-airline_stats_chart = (
-    table_subset.groupby('AC Operator')
-    .agg(
-        delayed_flights=('DelayedCalc', 'sum'),
-        total_departures=('AC Operator', 'count')
-    )
-    .reset_index()
-)
-airline_stats_chart = airline_stats_chart.sort_values(
-    'delayed_flights', ascending=False).head(top_table_rows)
+airline_stats_chart = top_rows(summary.airlines, 'delayed_flights', top_table_rows)
 airline_stats_chart['delayed_rate'] = (
     airline_stats_chart['delayed_flights'] / airline_stats_chart['total_departures'] * 100)
 airline_stats_chart = airline_stats_chart[[
     'AC Operator', 'delayed_flights', 'total_departures', 'delayed_rate']]
 
 # Additional Table: Top Country & City with most delays
-country_city_stats = (
-    table_subset.groupby(['Country', 'City'])
-    .agg(
-        delayed_flights=('DelayedCalc', 'sum'),
-        total_departures=('City', 'count')
-    )
-    .reset_index()
-)
-country_city_stats = country_city_stats.sort_values(
-    'delayed_flights', ascending=False).head(top_table_rows)
+country_city_stats = top_rows(summary.places, 'delayed_flights', top_table_rows)
 country_city_stats['delayed_rate'] = (
     country_city_stats['delayed_flights'] / country_city_stats['total_departures'] * 100)
 country_city_stats = country_city_stats[[
@@ -306,7 +233,7 @@ country_city_stats = country_city_stats[[
 # --------------------------------------------------------------------------------
 # 8) Create the Map
 # --------------------------------------------------------------------------------
-map_result = plot_flight_delays(str(selected_date), threshold_minutes,
+map_result = plot_flight_delays(selected_date, threshold_minutes,
                                 top_airports_count, min_flights_threshold, selected_airports)
 
 # --------------------------------------------------------------------------------
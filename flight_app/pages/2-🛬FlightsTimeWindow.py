@@ -1,14 +1,14 @@
 import streamlit as st
 import pandas as pd
-import os
-import glob
 from datetime import datetime, timedelta
 import altair as alt
 import folium
-from folium.plugins import TimestampedGeoJson
+import plotly.graph_objects as go
 from streamlit_folium import st_folium
 import numpy as np
 
+from flightdata import MIN_TURNAROUND, airport_cities, time_window, trace_delays
+
 # --------------------------------------------------------------------------------
 # 1) Page Setup
 # --------------------------------------------------------------------------------
@@ -31,35 +31,7 @@ st.markdown(
 # --------------------------------------------------------------------------------
 # 2) Load Data
 # --------------------------------------------------------------------------------
-
-
-@st.cache_data
-def load_data():
-    path = "flight_app/data"
-    parquet_files = glob.glob(os.path.join(path, '*.parquet'))
-    if not parquet_files:
-        st.error("No parquet files found in the specified directory!")
-        return pd.DataFrame()
-    df = pd.concat([pd.read_parquet(file)
-                   for file in parquet_files], ignore_index=True)
-
-    date_format = "%d-%m-%Y %H:%M:%S"
-    for col in ["FILED OFF BLOCK TIME", "ACTUAL OFF BLOCK TIME", "FILED ARRIVAL TIME", "ACTUAL ARRIVAL TIME"]:
-        df[col] = pd.to_datetime(df[col], format=date_format, errors="coerce")
-
-    df["DEPTDEL"] = (df["ACTUAL OFF BLOCK TIME"] -
-                     df["FILED OFF BLOCK TIME"]).dt.total_seconds() / 60
-    df["ARVLDEL"] = (df["ACTUAL ARRIVAL TIME"] -
-                     df["FILED ARRIVAL TIME"]).dt.total_seconds() / 60
-
-    # **Round Delay Values to 1 Decimal Place**
-    df["DEPTDEL"] = df["DEPTDEL"].round(1)
-    df["ARVLDEL"] = df["ARVLDEL"].round(1)
-
-    return df
-
-
-df = load_data()
+# Flights around the selected window are loaded once the sidebar is read (section 4)
 
 # --------------------------------------------------------------------------------
 # 3) Sidebar Controls with Updated Airport Selection
@@ -67,9 +39,9 @@ df = load_data()
 st.sidebar.title("Filters")
 
 # Create a DataFrame of unique airports with their corresponding cities.
-airport_options = df[["ADEP", "City"]].drop_duplicates().sort_values("ADEP")
-airport_options["option"] = airport_options["ADEP"] + \
-    " (" + airport_options["City"] + ")"
+airport_options = airport_cities()
+airport_options = airport_options.assign(option=airport_options["ADEP"] +
+                                         " (" + airport_options["City"] + ")")
 airport_display_options = airport_options["option"].tolist()
 
 default_airport = "LFPG"
@@ -98,59 +70,17 @@ delay_threshold = st.sidebar.slider(
     "Delay Threshold (minutes)", min_value=0, max_value=120, value=15, step=5)
 
 # --------------------------------------------------------------------------------
-# 4) Define Time Windows & Cache Filtered Data
+# 4) Define Time Windows & Load the Window's Flights
 # --------------------------------------------------------------------------------
-# Initialize session state keys if they do not exist.
-if "selected_airport" not in st.session_state:
-    st.session_state.selected_airport = selected_airport
-    st.session_state.selected_date = selected_date
-    st.session_state.selected_time = selected_time
-    st.session_state.dep_interval_hours = dep_interval_hours
-    st.session_state.prev_interval_hours = prev_interval_hours
-    st.session_state.delay_threshold = delay_threshold
-    st.session_state.filtered_df = None
-    st.session_state.delayed_flights = None
-
-# Check if any filter has changed or the filtered data is not initialized.
-if (
-    selected_airport != st.session_state.selected_airport
-    or selected_date != st.session_state.selected_date
-    or selected_time != st.session_state.selected_time
-    or dep_interval_hours != st.session_state.dep_interval_hours
-    or prev_interval_hours != st.session_state.prev_interval_hours
-    or delay_threshold != st.session_state.delay_threshold
-    or st.session_state.filtered_df is None
-    or st.session_state.delayed_flights is None
-):
-    st.session_state.selected_airport = selected_airport
-    st.session_state.selected_date = selected_date
-    st.session_state.selected_time = selected_time
-    st.session_state.dep_interval_hours = dep_interval_hours
-    st.session_state.prev_interval_hours = prev_interval_hours
-    st.session_state.delay_threshold = delay_threshold
-
-    end_time = datetime.combine(selected_date, selected_time)
-    start_time_dep = end_time - timedelta(hours=dep_interval_hours)
-    start_time_prev = end_time - timedelta(hours=prev_interval_hours)
-
-    filtered_df = df[df["ADEP"] == selected_airport]
-    filtered_df = filtered_df[
-        (filtered_df["ACTUAL OFF BLOCK TIME"] >= start_time_dep)
-        & (filtered_df["ACTUAL OFF BLOCK TIME"] <= end_time)
-    ]
-    delayed_flights = filtered_df[filtered_df["DEPTDEL"] > delay_threshold]
-
-    st.session_state.filtered_df = filtered_df
-    st.session_state.delayed_flights = delayed_flights
-else:
-    end_time = datetime.combine(
-        st.session_state.selected_date, st.session_state.selected_time)
-    start_time_dep = end_time - \
-        timedelta(hours=st.session_state.dep_interval_hours)
-    start_time_prev = end_time - \
-        timedelta(hours=st.session_state.prev_interval_hours)
-    filtered_df = st.session_state.filtered_df
-    delayed_flights = st.session_state.delayed_flights
+end_time = datetime.combine(selected_date, selected_time)
+start_time_dep = end_time - timedelta(hours=dep_interval_hours)
+start_time_prev = end_time - timedelta(hours=prev_interval_hours)
+
+# Computed once per selection and shared by every session looking at it; only
+# the partitions around the window are read (see `time_window`)
+window = time_window(selected_airport, end_time, dep_interval_hours,
+                     prev_interval_hours, delay_threshold)
+delayed_flights = window.delayed
 
 # Display the Departure Delay Time Window header (with time on the next line)
 st.markdown(
@@ -197,19 +127,10 @@ else:
 # 6) Show Previous Flights of Delayed Aircraft to Selected Airport with Arrival Delay
 # --------------------------------------------------------------------------------
 if not delayed_flights.empty:
-    tail_numbers = delayed_flights["AC Registration"].unique()
     last_departure_time = delayed_flights["ACTUAL OFF BLOCK TIME"].max()
 
-    previous_flights = df[
-        (df["AC Registration"].isin(tail_numbers))
-        & (df["ADES"] == selected_airport)
-        & (df["ACTUAL ARRIVAL TIME"] >= start_time_prev)
-        & (df["ACTUAL ARRIVAL TIME"] <= last_departure_time)
-    ]
-
-    delayed_previous_flights = previous_flights[previous_flights["ARVLDEL"] > 15]
-    delayed_previous_flights = delayed_previous_flights.sort_values(
-        by="ACTUAL ARRIVAL TIME", ascending=False)
+    # The inbound leg of each delayed departure, linked at ingest
+    delayed_previous_flights = window.previous
 
     st.markdown(
         f"<h4 style='font-size:20px;'>Previous Flights of Delayed Aircraft to {selected_airport} (Arrival Delay > 15 min)</h4>",
@@ -250,13 +171,7 @@ if not delayed_flights.empty:
         # 7) Show Route History of Selected Aircraft
         # --------------------------------------------------------------------------------
         if selected_ac:
-            route_history = df[
-                (df["AC Registration"] == selected_ac)
-                & (df["ACTUAL OFF BLOCK TIME"] >= start_time_prev)
-                & (df["ACTUAL OFF BLOCK TIME"] <= last_departure_time)
-            ]
-            route_history = route_history.sort_values(
-                by="ACTUAL OFF BLOCK TIME", ascending=False)
+            route_history = window.routes[window.routes["AC Registration"] == selected_ac]
 
             st.markdown(
                 f"<h4 style='font-size:20px;'>Route History of {selected_ac} (From {start_time_prev} to {last_departure_time})</h4>",
@@ -304,8 +219,8 @@ if not delayed_flights.empty:
                 # 8) Gantt Chart for Route History with Enhanced Visualization
                 # --------------------------------------------------------------------------------
                 def plot_route_history_chart(route_history):
-                    route_history["Flight_Label"] = route_history["ADEP"] + \
-                        " → " + route_history["ADES"]
+                    route_history["Flight_Label"] = route_history["ADEP"].astype(str) + \
+                        " → " + route_history["ADES"].astype(str)
                     route_history["Departure_Status"] = route_history["DEPTDEL"].apply(
                         lambda x: "Delayed" if x > delay_threshold else "On Time"
                     )
@@ -387,27 +302,67 @@ st.markdown("<h4 style='font-size:20px;'>Route History Map</h4>",
             unsafe_allow_html=True)
 
 
-def create_arc(start, end, num_points=50, curvature=0.2):
-    # start and end are tuples: (lat, lon)
-    lat1, lon1 = start
-    lat2, lon2 = end
-    # Calculate midpoint
-    mid_lat, mid_lon = (lat1 + lat2) / 2, (lon1 + lon2) / 2
-    # Offset for control point (adjust curvature)
-    delta_lat = lat2 - lat1
-    delta_lon = lon2 - lon1
-    control_lat = mid_lat + curvature * (-delta_lon)
-    control_lon = mid_lon + curvature * delta_lat
-    # Create points along the Bézier curve
-    t_values = np.linspace(0, 1, num_points)
-    arc_points = []
-    for t in t_values:
-        lat = (1 - t) ** 2 * lat1 + 2 * (1 - t) * \
-            t * control_lat + t ** 2 * lat2
-        lon = (1 - t) ** 2 * lon1 + 2 * (1 - t) * \
-            t * control_lon + t ** 2 * lon2
-        arc_points.append([lat, lon])
-    return arc_points
+def create_arcs(start, end, num_points=50, curvature=0.2):
+    # start and end are (legs, 2) arrays of (lat, lon); returns (legs, points, 2)
+    start, end = np.asarray(start, dtype=float), np.asarray(end, dtype=float)
+    delta = end - start
+    # Control point: the midpoint offset perpendicular to the leg (adjusts curvature)
+    control = (start + end) / 2 + curvature * np.stack([-delta[:, 1], delta[:, 0]], axis=1)
+    # Quadratic Bézier weights of every point, broadcast over all legs at once
+    t = np.linspace(0, 1, num_points)[None, :, None]
+    return ((1 - t) ** 2 * start[:, None] + 2 * (1 - t) * t * control[:, None]
+            + t ** 2 * end[:, None])
+
+
+# Tooltip fields of each route, with the labels shown for them
+ROUTE_TOOLTIP = {
+    "operator": "AC Operator", "type": "AC Type", "departure": "Departure",
+    "fdept": "FDEPT", "adept": "ADEPT", "arrival": "Arrival",
+    "farvt": "FARVT", "aarvt": "AARVT",
+}
+
+
+def route_features(routes):
+    # One GeoJSON LineString per leg; tooltip text and colour travel as properties
+    arcs = create_arcs(routes[["ADEP Latitude", "ADEP Longitude"]].to_numpy(),
+                       routes[["ADES Latitude", "ADES Longitude"]].to_numpy())
+    # GeoJSON positions are (lon, lat)
+    coordinates = arcs[:, :, ::-1].tolist()
+
+    def stamp(col):
+        return routes[col].dt.strftime("%Y-%m-%d %H:%M").fillna("N/A")
+
+    properties = pd.DataFrame({
+        "operator": routes["AC Operator"].astype(str),
+        "type": routes["AC Type"].astype(str),
+        "departure": routes["ADEP"].astype(str),
+        "fdept": stamp("FILED OFF BLOCK TIME"),
+        "adept": stamp("ACTUAL OFF BLOCK TIME"),
+        "arrival": routes["ADES"].astype(str),
+        "farvt": stamp("FILED ARRIVAL TIME"),
+        "aarvt": stamp("ACTUAL ARRIVAL TIME"),
+        "color": np.where(routes["DEPTDEL"] > delay_threshold, "orange", "green"),
+    }).to_dict("records")
+    return {
+        "type": "FeatureCollection",
+        "features": [{"type": "Feature", "properties": props,
+                      "geometry": {"type": "LineString", "coordinates": coords}}
+                     for props, coords in zip(properties, coordinates)],
+    }
+
+
+def airport_features(routes):
+    # One GeoJSON Point per airport the routes touch
+    ends = [routes[[code, f"{code} Latitude", f"{code} Longitude"]].set_axis(
+        ["Airport", "Latitude", "Longitude"], axis=1) for code in ("ADEP", "ADES")]
+    nodes = pd.concat(ends).drop_duplicates(subset=["Airport"])
+    return {
+        "type": "FeatureCollection",
+        "features": [{"type": "Feature", "properties": {"airport": airport},
+                      "geometry": {"type": "Point", "coordinates": [lon, lat]}}
+                     for airport, lat, lon in zip(nodes["Airport"].astype(str),
+                                                  nodes["Latitude"], nodes["Longitude"])],
+    }
 
 
 if "route_history" in locals() and not route_history.empty:
@@ -425,51 +380,86 @@ if "route_history" in locals() and not route_history.empty:
     folium.TileLayer("OpenStreetMap").add_to(m)
     folium.LayerControl().add_to(m)
 
-    for _, row in route_history.iterrows():
-        start_coord = [row["ADEP Latitude"], row["ADEP Longitude"]]
-        end_coord = [row["ADES Latitude"], row["ADES Longitude"]]
-        arc_coords = create_arc(start_coord, end_coord, curvature=0.2)
-        filed_departure = row["FILED OFF BLOCK TIME"]
-        actual_departure = row["ACTUAL OFF BLOCK TIME"]
-        filed_arrival = row["FILED ARRIVAL TIME"]
-        actual_arrival = row["FILED ARRIVAL TIME"]
-        tooltip_text = (
-            f"AC Operator: {row['AC Operator']}<br>"
-            f"AC Type: {row['AC Type']}<br>"
-            f"Departure: {row['ADEP']}<br>"
-            f"FDEPT: {filed_departure.strftime('%Y-%m-%d %H:%M') if pd.notnull(filed_departure) else 'N/A'}<br>"
-            f"ADEPT: {actual_departure.strftime('%Y-%m-%d %H:%M') if pd.notnull(actual_departure) else 'N/A'}<br>"
-            f"Arrival: {row['ADES']}<br>"
-            f"FARVT: {filed_arrival.strftime('%Y-%m-%d %H:%M') if pd.notnull(filed_arrival) else 'N/A'}<br>"
-            f"AARVT: {actual_arrival.strftime('%Y-%m-%d %H:%M') if pd.notnull(actual_arrival) else 'N/A'}"
-        )
-        route_color = "orange" if row["DEPTDEL"] > delay_threshold else "green"
-        folium.PolyLine(arc_coords, color="transparent", weight=10,
-                        opacity=0, tooltip=tooltip_text).add_to(m)
-        folium.PolyLine(arc_coords, color=route_color, weight=2,
-                        opacity=0.7, tooltip=tooltip_text).add_to(m)
-
-    nodes = pd.concat(
-        [
-            route_history[["ADEP", "ADEP Latitude", "ADEP Longitude"]].rename(
-                columns={"ADEP": "Airport", "ADEP Latitude": "Latitude",
-                         "ADEP Longitude": "Longitude"}
-            ),
-            route_history[["ADES", "ADES Latitude", "ADES Longitude"]].rename(
-                columns={"ADES": "Airport", "ADES Latitude": "Latitude",
-                         "ADES Longitude": "Longitude"}
-            ),
-        ]
-    ).drop_duplicates(subset=["Airport"])
-
-    for idx, row in nodes.iterrows():
-        popup_text = f"{row['Airport']}"
-        folium.Marker(
-            location=[row["Latitude"], row["Longitude"]],
-            popup=popup_text,
-            icon=folium.Icon(color="blue", icon="plane", prefix="fa"),
-        ).add_to(m)
+    folium.GeoJson(
+        route_features(route_history),
+        name="Routes",
+        style_function=lambda feature: {"color": feature["properties"]["color"],
+                                        "weight": 2, "opacity": 0.7},
+        highlight_function=lambda feature: {"weight": 4, "opacity": 1},
+        tooltip=folium.GeoJsonTooltip(fields=list(ROUTE_TOOLTIP),
+                                      aliases=[f"{label}:" for label in ROUTE_TOOLTIP.values()]),
+    ).add_to(m)
+    folium.GeoJson(
+        airport_features(route_history),
+        name="Airports",
+        marker=folium.Marker(icon=folium.Icon(color="blue", icon="plane", prefix="fa")),
+        popup=folium.GeoJsonPopup(fields=["airport"], labels=False),
+    ).add_to(m)
 
     st_folium(m, width=800, height=500)
 else:
     st.warning("No route history available for map visualization.")
+
+# --------------------------------------------------------------------------------
+# 10) Trace Reactionary Delay Propagation
+# --------------------------------------------------------------------------------
+
+
+def propagation_sankey(flows):
+    # Nodes are added with their first link; minutes below 0.1 are left out
+    nodes, sources, targets, values = {}, [], [], []
+
+    def link(source, target, value):
+        if value >= 0.1:
+            sources.append(nodes.setdefault(source, len(nodes)))
+            targets.append(nodes.setdefault(target, len(nodes)))
+            values.append(value)
+
+    departure = f"Departure delay at {selected_airport}"
+    for hop, row in flows.iterrows():
+        where = selected_airport if hop == 0 else f"leg -{hop} departure"
+        link(departure, f"Generated at {where}", row["local"])
+        inbound = f"Inbound leg -{hop + 1}"
+        link(departure, inbound, row["inherited"])
+        link(inbound, f"En route, leg -{hop + 1}", row["en_route"])
+        link(inbound, "Earlier legs (not traced)", row["untraced"])
+        departure = f"Leg -{hop + 1} departure"
+        link(inbound, departure, row["inherited"] - row["en_route"] - row["untraced"])
+
+    fig = go.Figure(go.Sankey(
+        node=dict(label=list(nodes), pad=15, thickness=15),
+        link=dict(source=sources, target=targets, value=values),
+        valueformat=".0f", valuesuffix=" min",
+    ))
+    fig.update_layout(height=450, margin=dict(l=10, r=10, t=10, b=10))
+    return fig
+
+
+if not delayed_flights.empty:
+    st.markdown(
+        f"<h4 style='font-size:20px;'>Reactionary Delay Propagation (Since {start_time_prev})</h4>",
+        unsafe_allow_html=True,
+    )
+    trace_col1, trace_col2 = st.columns(2)
+    trace_hops = trace_col1.slider(
+        "Legs to Trace Back", min_value=1, max_value=8, value=4)
+    min_turnaround = trace_col2.slider(
+        "Minimum Turnaround (minutes)", min_value=10, max_value=120, value=MIN_TURNAROUND, step=5,
+        help="Scheduled ground time beyond this absorbs inbound delay")
+
+    # All delayed departures are walked back along their rotation chains at once
+    attribution, flows = trace_delays(delayed_flights, trace_hops, start_time_prev, min_turnaround)
+    st.plotly_chart(propagation_sankey(flows), use_container_width=True)
+
+    traced = delayed_flights[["ECTRL ID", "ADES", "AC Registration", "DEPTDEL"]].join(
+        attribution.round(1))
+    st.dataframe(
+        traced.sort_values("INHERITED DELAY", ascending=False, kind="stable"),
+        hide_index=True,
+        column_config={
+            "DEPTDEL": "Departure Delay (min)",
+            "LOCAL DELAY": "Generated Locally (min)",
+            "INHERITED DELAY": "Inherited (min)",
+            "HOPS": "Legs Traced",
+        },
+    )